@@ -11,6 +11,9 @@
 #
 ####################################################################################################################
 
+import time
+_importStart = time.perf_counter()
+
 import dbus, dbus.exceptions
 import dbus.mainloop.glib
 import dbus.service
@@ -19,10 +22,20 @@ try:
   from gi.repository import GObject
 except ImportError:
   import gobject as GObject
+
+import bisect
+import json
+import os
+from array import array
+import struct
 import sys
+from collections import deque
 
 mainloop = None
 hidService = None
+devices = []
+startup = None
+bluez = None
 
 BLUEZ_SERVICE_NAME = 'org.bluez'
 GATT_MANAGER_IFACE = 'org.bluez.GattManager1'
@@ -33,6 +46,50 @@ GATT_SERVICE_IFACE = 'org.bluez.GattService1'
 GATT_CHRC_IFACE =    'org.bluez.GattCharacteristic1'
 GATT_DESC_IFACE =    'org.bluez.GattDescriptor1'
 
+ADAPTER_IFACE =                'org.bluez.Adapter1'
+LE_ADVERTISING_MANAGER_IFACE = 'org.bluez.LEAdvertisingManager1'
+LE_ADVERTISEMENT_IFACE =       'org.bluez.LEAdvertisement1'
+DEVICE_IFACE =                 'org.bluez.Device1'
+
+DEVICES_FILE =      os.environ.get('HID_DEVICES', os.path.expanduser('~/.smartRemotes/devices.json'))
+CONFIG_FILE =       os.environ.get('HID_CONFIG', os.path.expanduser('~/.smartRemotes/config.json'))
+BONDED_HOSTS_FILE = os.environ.get('HID_BONDED_HOSTS', os.path.expanduser('~/.smartRemotes/bondedHosts.json'))
+DISCOVERABLE =      os.environ.get('HID_DISCOVERABLE', 'always')  # 'always' or 'unbonded'
+ADV_INTERVALS =     bool(os.environ.get('HID_ADV_INTERVALS'))     # bluetoothd runs with --experimental
+TRACE =             bool(os.environ.get('HID_TRACE'))
+INPUT_POLICY =      os.environ.get('HID_INPUT_POLICY', 'drop')   # 'drop' or 'buffer'
+INPUT_BUFFER_SIZE = os.environ.get('HID_INPUT_BUFFER', '256')
+
+if INPUT_POLICY not in ('drop', 'buffer'):
+    raise ValueError(f"HID_INPUT_POLICY must be 'drop' or 'buffer', not {INPUT_POLICY!r}")
+
+if not INPUT_BUFFER_SIZE.isdigit() or int(INPUT_BUFFER_SIZE) < 1:
+    raise ValueError(f'HID_INPUT_BUFFER must be a positive number of reports, not {INPUT_BUFFER_SIZE!r}')
+INPUT_BUFFER_SIZE = int(INPUT_BUFFER_SIZE)
+
+if DISCOVERABLE not in ('always', 'unbonded'):
+    raise ValueError(f"HID_DISCOVERABLE must be 'always' or 'unbonded', not {DISCOVERABLE!r}")
+
+def trace(message):
+    if TRACE: print(message)
+
+class StartupTimer(object):
+    """
+    Records how long after process start each startup phase completed.
+    """
+    def __init__(self, start):
+        self.start = start
+        self.marks = []
+        self.done = False
+
+    def mark(self, phase):
+        if self.done or phase in dict(self.marks): return
+        self.marks.append((phase, time.perf_counter() - self.start))
+
+    def report(self):
+        self.done = True
+        print('Startup: ' + ', '.join(f'{phase} {elapsed * 1000:.1f} ms' for phase, elapsed in self.marks))
+
 class InvalidArgsException(dbus.exceptions.DBusException):
     _dbus_error_name = 'org.freedesktop.DBus.Error.InvalidArgs'
 
@@ -52,22 +109,227 @@ class FailedException(dbus.exceptions.DBusException):
 class Application(dbus.service.Object):
     """
     org.bluez.GattApplication1 interface implementation
+
+    Services can be added, replaced and removed while registered. Removals are
+    announced with InterfacesRemoved, which bluetoothd applies incrementally.
+    bluetoothd only builds its database from the tree at registration time, so
+    additions (and report map changes, which hosts only re-read after a
+    Service Changed indication) also re-register the application.
+
+    Each virtual device has its own Application rooted at PATH_BASE + index,
+    with all of its services beneath that root.
     """
-    def __init__(self, bus):
+    PATH_BASE = '/org/bluez/example/device'
+
+    def __init__(self, bus, index=0):
  
-        self.path = '/'
+        self.path = self.PATH_BASE + str(index)
+        self.servicePathBase = self.path + '/service'
+        self.bus = bus
         self.services = []
+        self.config = self.config_defaults()
+        self.serviceManager = None
+        self.registered = False
+        self.pending = False
+        self.valueTree = None
+        self.definitions = None
+        self.treeIndex = 0
+        self.deviceInfo = None
+        self.advertiser = None
+        self.failed = False
+        self.idle = IdleMonitor(self.path)
+        self.inputBuffer = InputBuffer()
         dbus.service.Object.__init__(self, bus, self.path)
         
-        self.add_service(HIDService(bus, 0))
-        self.add_service(DeviceInfoService(bus, 1))
-        self.add_service(BatteryService(bus, 2))
+        self.hidService = HIDService(bus, 0, self.servicePathBase)
+        self.battery = BatteryService(bus, 2, self.servicePathBase)
+
+        self.add_service(self.hidService)
+        self.add_service(self.battery)
+        self.build_value_tree()
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
 
-    def add_service(self, service):
+    @staticmethod
+    def get_objects(service):
+        objects = [service]
+
+        for chrc in service.get_characteristics():
+            objects.append(chrc)
+            objects.extend(chrc.get_descriptors())
+
+        return objects
+
+    def add_service(self, service, reregister=True):
         self.services.append(service)
+        if isinstance(service, Service):
+            service.idle = self.idle
+            service.inputBuffer = self.inputBuffer
+        if not self.registered: return
+
+        for obj in self.get_objects(service):
+            self.InterfacesAdded(obj.get_path(), obj.get_properties())
+
+        if reregister: self.reregister()
+
+    def remove_service(self, service):
+        if service not in self.services: return
+        self.services.remove(service)
+
+        #a removed service must not keep the device out of idle
+        for chrc in service.get_characteristics():
+            if chrc in self.idle.subscribers: chrc.StopNotify()
+
+        for obj in reversed(self.get_objects(service)):
+            if self.registered: self.InterfacesRemoved(obj.get_path(), list(obj.get_properties().keys()))
+            if isinstance(obj, dbus.service.Object): obj.remove_from_connection()
+
+    def set_value_tree(self, valueTree):
+        if self.valueTree is not None:
+            for service in self.valueTree.services: self.remove_service(service)
+            self.valueTree.remove_from_connection()
+
+        self.valueTree = valueTree
+        if valueTree is None: return
+
+        #one re-registration for the whole tree
+        for service in valueTree.services: self.add_service(service, reregister=False)
+        self.reregister()
+
+    def build_value_tree(self):
+        #device information plus any loaded definitions, served as one tree
+        definitions = list(self.definitions or ())
+        if self.config['deviceInfo']:
+            definitions.insert(0, device_info_definition(self.config['vendor'], self.config['product'], self.config['version']))
+
+        #the new tree gets a path of its own, so the live one is only
+        #replaced once its successor is built
+        valueTree = None
+        if definitions:
+            try:
+                valueTree = ValueTree(self.bus, self.treeIndex, definitions, self.path + '/values')
+            except (ValueError, KeyError, TypeError, AttributeError) as error:
+                print(f'Value tree not built: {error}')
+                return
+
+            self.treeIndex += 1
+
+        self.deviceInfo = valueTree.services[0] if valueTree and self.config['deviceInfo'] else None
+        self.set_value_tree(valueTree)
+
+    def register(self, serviceManager):
+        self.serviceManager = serviceManager
+        self.pending = True
+        serviceManager.RegisterApplication(self.get_path(), dbus.Dictionary({}, signature='sv'),
+                                           reply_handler=self.register_cb,
+                                           error_handler=self.register_error_cb)
+
+    def reregister(self):
+        if not self.registered or self.serviceManager is None: return
+        print('Re-registering GATT application...')
+        self.registered = False
+        self.pending = True
+
+        manager = self.serviceManager
+        manager.UnregisterApplication(self.get_path(),
+                                      reply_handler=lambda: self.unregister_cb(manager),
+                                      error_handler=lambda error: self.unregister_cb(manager))
+
+    def unregister_cb(self, manager):
+        #bluetoothd went away while unregistering, discovery registers again
+        if self.serviceManager is not manager:
+            self.pending = False
+            return
+
+        self.register(manager)
+
+    def register_cb(self):
+        self.registered = True
+        self.pending = False
+        self.failed = False
+        register_app_cb(self)
+        if self.advertiser: self.advertiser.start()
+
+    def register_error_cb(self, error):
+        #registered by an earlier call that raced this one
+        if getattr(error, 'get_dbus_name', lambda: None)() == 'org.bluez.Error.AlreadyExists':
+            self.register_cb()
+            return
+
+        self.registered = False
+        self.pending = False
+        self.failed = True
+        register_app_error_cb(self, error)
+
+    def detach(self):
+        #bluetoothd is gone: its subscriptions and registration went with it
+        for chrc in list(self.idle.subscribers): chrc.StopNotify()
+
+        self.registered = False
+        self.pending = False
+        self.serviceManager = None
+        if self.advertiser: self.advertiser.reset()
+
+    def close(self):
+        #the device is dropped: unexport the whole tree and stop its timers
+        self.set_value_tree(None)
+        for service in list(self.services): self.remove_service(service)
+
+        for sourceId in self.idle.sources.values(): GObject.source_remove(sourceId)
+        self.idle.sources.clear()
+        self.remove_from_connection()
+
+    def config_defaults(self):
+        #a key missing from the config file falls back to these
+        defaults = {key: value for key, uuid, value in DEVICE_INFO_STRINGS}
+        defaults.update({'deviceInfo': True, 'battery': True,
+                         'reportMap': ReportMapCharacteristic.VALUE, 'definitions': None})
+        return defaults
+
+    def apply_config(self, config):
+        config = {**self.config_defaults(), **config}
+        changed = {key for key in set(self.config) | set(config) if self.config.get(key) != config.get(key)}
+        self.config = config
+        if not changed: return
+        print(f'Apply config: {sorted(changed)}')
+
+        if 'battery' in changed:
+            if not config['battery']:
+                self.remove_service(self.battery)
+            elif self.battery not in self.services:
+                self.battery = BatteryService(self.bus, 2, self.servicePathBase)
+                self.add_service(self.battery)
+
+        definitions = self.definitions
+        if 'definitions' in changed:
+            try:
+                self.definitions = load_definitions(config['definitions']) if config['definitions'] else None
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+                print(f'Definitions not loaded: {error}')
+                self.definitions = None
+
+        #a definitions file that failed to load leaves the tree as it was
+        if 'deviceInfo' in changed or self.definitions != definitions:
+            self.build_value_tree()
+        elif {'vendor', 'product', 'version'} & changed and self.deviceInfo is not None:
+            #read on demand by bluetoothd, nothing to re-register
+            for chrc, (key, uuid, default) in zip(self.deviceInfo.characteristics, DEVICE_INFO_STRINGS):
+                chrc.value = str(config[key]).encode()
+                print(f'***Device info {key}***: {chrc.value}')
+
+        if 'reportMap' in changed:
+            if not isinstance(config['reportMap'], str):
+                print(f'Invalid reportMap: expected a hex string, got {type(config["reportMap"]).__name__}')
+                return
+
+            try:
+                self.hidService.reportMap.set_value(config['reportMap'])
+            except ValueError as error:
+                print(f'Invalid reportMap: {error}')
+                return
+
+            self.reregister()
 
     @dbus.service.method(DBUS_OM_IFACE, out_signature='a{oa{sa{sv}}}')
     def GetManagedObjects(self):
@@ -85,6 +347,206 @@ class Application(dbus.service.Object):
 
         return response
 
+    @dbus.service.signal(DBUS_OM_IFACE, signature='oa{sa{sv}}')
+    def InterfacesAdded(self, path, interfaces):
+        pass
+
+    @dbus.service.signal(DBUS_OM_IFACE, signature='oas')
+    def InterfacesRemoved(self, path, interfaces):
+        pass
+
+
+class ConfigWatcher(object):
+    """
+    Watches the JSON config file and hands changed settings to the Application.
+
+    {
+        "vendor": "HodgeCode",
+        "product": "smartRemotes",
+        "version": "version 1.0.0",
+        "reportMap": "05010906a101...",
+        "deviceInfo": true,
+        "battery": true,
+        "definitions": "/etc/smartRemotes/services.toml"
+    }
+
+    definitions names a file of declarative services served by a ValueTree.
+    """
+    SETTLE_MS = 200
+    POLL_SECONDS = 2
+
+    def __init__(self, fileName, app):
+        self.fileName = fileName
+        self.app = app
+        self.timer = None
+        self.poller = None
+        self.mtime = None
+        self.monitor = None
+
+        #Gio is only needed here, don't pay for it at import
+        try:
+            from gi.repository import Gio
+            self.monitor = Gio.File.new_for_path(fileName).monitor_file(Gio.FileMonitorFlags.NONE, None)
+            self.monitor.connect('changed', self.file_changed)
+            self.changesDone = (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.CREATED)
+        except ImportError:
+            self.poller = GObject.timeout_add_seconds(self.POLL_SECONDS, self.poll)
+
+        self.load()
+
+    def load(self):
+        self.timer = None
+
+        try:
+            self.mtime = os.stat(self.fileName).st_mtime
+            with open(self.fileName) as configFile:
+                config = json.load(configFile)
+        except OSError:
+            return False
+        except ValueError as error:
+            print(f'Config not loaded: {error}')
+            return False
+
+        if not isinstance(config, dict):
+            print(f'Config not loaded: expected an object, got {type(config).__name__}')
+            return False
+
+        self.app.apply_config(config)
+        return False
+
+    def file_changed(self, monitor, file, otherFile, event):
+        if event not in self.changesDone: return
+
+        #editors write in several steps, apply once they settle
+        if self.timer is not None: GObject.source_remove(self.timer)
+        self.timer = GObject.timeout_add(self.SETTLE_MS, self.load)
+
+    def poll(self):
+        try:
+            mtime = os.stat(self.fileName).st_mtime
+        except OSError:
+            return True
+
+        if mtime != self.mtime: self.load()
+        return True
+
+    def stop(self):
+        if self.monitor is not None: self.monitor.cancel()
+        for sourceId in (self.timer, self.poller):
+            if sourceId is not None: GObject.source_remove(sourceId)
+
+        self.monitor = self.timer = self.poller = None
+
+
+class IdleMonitor(object):
+    """
+    Idle state machine for the notify sources of one device.
+
+    Timers of the HID and battery services are armed through arm(), which
+    keys them by owner and counts every wakeup. While no host is subscribed
+    and no report is queued the device is idle: every armed source is
+    removed, so the process is not woken at all. The first StartNotify or
+    injected input leaves idle again, and each return to idle reports the
+    wakeups/sec seen while active.
+    """
+    def __init__(self, name=''):
+        self.name = name
+        self.subscribers = set()
+        self.queues = []
+        self.sources = {}
+        self.idle = True
+        self.wakeups = 0
+        self.activeSince = None
+
+    def add_queue(self, pending):
+        if pending not in self.queues: self.queues.append(pending)
+
+    def wake(self):
+        if not self.idle: return
+        self.idle = False
+        self.wakeups = 0
+        self.activeSince = time.monotonic()
+        print(f'{self.name} active')
+
+    def wakeup_rate(self):
+        if self.idle or self.activeSince is None: return 0.0
+        return self.wakeups / max(time.monotonic() - self.activeSince, 0.001)
+
+    def check_idle(self):
+        if self.idle or self.subscribers: return
+        if any(pending() for pending in self.queues): return
+
+        rate = self.wakeup_rate()
+        for sourceId in self.sources.values(): GObject.source_remove(sourceId)
+        self.sources.clear()
+        self.idle = True
+        print(f'{self.name} idle ({rate:.2f} wakeups/sec while active)')
+
+    def subscribe(self, owner):
+        self.subscribers.add(owner)
+        self.wake()
+
+    def unsubscribe(self, owner):
+        self.subscribers.discard(owner)
+        self.check_idle()
+
+    def armed(self, owner, name):
+        return (owner, name) in self.sources
+
+    def arm(self, owner, name, interval, callback):
+        key = (owner, name)
+        if key in self.sources: return
+        self.wake()
+
+        def wakeup():
+            self.wakeups += 1
+            if callback(): return True
+
+            if self.sources.get(key) == sourceId: del self.sources[key]
+            self.check_idle()
+            return False
+
+        sourceId = GObject.timeout_add(interval, wakeup)
+        self.sources[key] = sourceId
+
+    def disarm(self, owner, name):
+        sourceId = self.sources.pop((owner, name), None)
+        if sourceId is not None: GObject.source_remove(sourceId)
+
+
+class InputBuffer(object):
+    """
+    Input reports injected while no host is subscribed.
+
+    With the 'drop' policy they are discarded. With 'buffer' the newest
+    size reports are kept and replayed by their characteristic on its next
+    StartNotify, e.g. once a host reconnects after bluetoothd restarts.
+    """
+    def __init__(self, policy=INPUT_POLICY, size=INPUT_BUFFER_SIZE):
+        self.policy = policy
+        self.reports = deque(maxlen=size)
+        self.dropped = 0
+
+    def push(self, owner, report):
+        if self.policy != 'buffer' or len(self.reports) == self.reports.maxlen: self.dropped += 1
+        if self.policy != 'buffer': return False
+
+        self.reports.append((owner, report))
+        return True
+
+    def take(self, owner):
+        reports = [report for reportOwner, report in self.reports if reportOwner is owner]
+
+        if reports or self.dropped:
+            print(f'Input buffer: replaying {len(reports)} reports, {self.dropped} dropped while unsubscribed')
+            self.dropped = 0
+
+        if not reports: return reports
+
+        self.reports = deque(((reportOwner, report) for reportOwner, report in self.reports if reportOwner is not owner),
+                             maxlen=self.reports.maxlen)
+        return reports
+
 
 class Service(dbus.service.Object):
     """
@@ -92,30 +554,37 @@ class Service(dbus.service.Object):
     """
     PATH_BASE = '/org/bluez/example/service'
 
-    def __init__(self, bus, index, uuid, primary):
-        self.path = self.PATH_BASE + str(index)
+    def __init__(self, bus, index, uuid, primary, pathBase=None):
+        self.path = (pathBase or self.PATH_BASE) + str(index)
         self.bus = bus
         self.uuid = uuid
         self.primary = primary
         self.characteristics = []
+        self.idle = None        # shared IdleMonitor, set by Application.add_service
+        self.inputBuffer = None # shared InputBuffer, set by Application.add_service
+        self.propertyCache = None
         dbus.service.Object.__init__(self, bus, self.path)
 
     def get_properties(self):
-        return {
-                GATT_SERVICE_IFACE: {
-                        'UUID': self.uuid,
-                        'Primary': self.primary,
-                        'Characteristics': dbus.Array(
-                                self.get_characteristic_paths(),
-                                signature='o')
-                }
-        }
+        if self.propertyCache is None:
+            self.propertyCache = {
+                    GATT_SERVICE_IFACE: {
+                            'UUID': self.uuid,
+                            'Primary': self.primary,
+                            'Characteristics': dbus.Array(
+                                    self.get_characteristic_paths(),
+                                    signature='o')
+                    }
+            }
+
+        return self.propertyCache
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
 
     def add_characteristic(self, characteristic):
         self.characteristics.append(characteristic)
+        self.propertyCache = None
 
     def get_characteristic_paths(self):
         result = []
@@ -145,27 +614,32 @@ class Characteristic(dbus.service.Object):
         self.bus = bus
         self.uuid = uuid
         self.service = service
-        self.flags = flags
+        self.flags = flag_array(flags)
         self.descriptors = []
+        self.propertyCache = None
         dbus.service.Object.__init__(self, bus, self.path)
 
     def get_properties(self):
-        return {
-                GATT_CHRC_IFACE: {
-                        'Service': self.service.get_path(),
-                        'UUID': self.uuid,
-                        'Flags': self.flags,
-                        'Descriptors': dbus.Array(
-                                self.get_descriptor_paths(),
-                                signature='o')
-                }
-        }
+        if self.propertyCache is None:
+            self.propertyCache = {
+                    GATT_CHRC_IFACE: {
+                            'Service': self.service.get_path(),
+                            'UUID': self.uuid,
+                            'Flags': self.flags,
+                            'Descriptors': dbus.Array(
+                                    self.get_descriptor_paths(),
+                                    signature='o')
+                    }
+            }
+
+        return self.propertyCache
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
 
     def add_descriptor(self, descriptor):
         self.descriptors.append(descriptor)
+        self.propertyCache = None
 
     def get_descriptor_paths(self):
         result = []
@@ -222,18 +696,22 @@ class Descriptor(dbus.service.Object):
         self.path = characteristic.path + '/desc' + str(index)
         self.bus = bus
         self.uuid = uuid
-        self.flags = flags
+        self.flags = flag_array(flags)
         self.chrc = characteristic
+        self.propertyCache = None
         dbus.service.Object.__init__(self, bus, self.path)
 
     def get_properties(self):
-        return {
-                GATT_DESC_IFACE: {
-                        'Characteristic': self.chrc.get_path(),
-                        'UUID': self.uuid,
-                        'Flags': self.flags,
-                }
-        }
+        if self.propertyCache is None:
+            self.propertyCache = {
+                    GATT_DESC_IFACE: {
+                            'Characteristic': self.chrc.get_path(),
+                            'UUID': self.uuid,
+                            'Flags': self.flags,
+                    }
+            }
+
+        return self.propertyCache
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
@@ -259,6 +737,327 @@ class Descriptor(dbus.service.Object):
         print('Default WriteValue called, returning error')
         raise NotSupportedException()
 
+######################################################
+# VALUE TREE
+######################################################
+_flagArrays = {}
+_valueArrays = {}
+
+def flag_array(flags):
+    # identical flag lists share one dbus.Array
+    flags = tuple(flags)
+    if flags not in _flagArrays: _flagArrays[flags] = dbus.Array(flags, signature='s')
+    return _flagArrays[flags]
+
+def value_array(hexValue):
+    # identical fixed values (report maps, report references) are shared by every device
+    hexValue = hexValue.lower()
+    if hexValue not in _valueArrays: _valueArrays[hexValue] = dbus.Array(bytearray.fromhex(hexValue), signature=dbus.Signature('y'))
+    return _valueArrays[hexValue]
+
+
+class ValueService(object):
+    """
+    GATT service record served by a ValueTree.
+    """
+    __slots__ = ('path', 'uuid', 'primary', 'characteristics', 'characteristicPaths')
+
+    def __init__(self, path, uuid, primary, characteristics):
+        self.path = dbus.ObjectPath(path)
+        self.uuid = uuid
+        self.primary = dbus.Boolean(primary)
+        self.characteristics = tuple(characteristics)
+        self.characteristicPaths = dbus.Array([chrc.path for chrc in self.characteristics], signature='o')
+
+    def get_path(self):
+        return self.path
+
+    def get_properties(self):
+        return {
+                GATT_SERVICE_IFACE: {
+                        'UUID': self.uuid,
+                        'Primary': self.primary,
+                        'Characteristics': self.characteristicPaths
+                }
+        }
+
+    def get_characteristics(self):
+        return self.characteristics
+
+
+class ValueCharacteristic(object):
+    """
+    GATT characteristic record with a fixed value, served by a ValueTree.
+    """
+    __slots__ = ('path', 'servicePath', 'uuid', 'flags', 'value', 'descriptors', 'descriptorPaths')
+
+    def __init__(self, path, servicePath, uuid, flags, value, descriptors):
+        self.path = dbus.ObjectPath(path)
+        self.servicePath = servicePath
+        self.uuid = uuid
+        self.flags = flag_array(flags)
+        self.value = bytes(value)
+        self.descriptors = tuple(descriptors)
+        self.descriptorPaths = dbus.Array([desc.path for desc in self.descriptors], signature='o')
+
+    def get_path(self):
+        return self.path
+
+    def get_properties(self):
+        return {
+                GATT_CHRC_IFACE: {
+                        'Service': self.servicePath,
+                        'UUID': self.uuid,
+                        'Flags': self.flags,
+                        'Descriptors': self.descriptorPaths
+                }
+        }
+
+    def get_descriptors(self):
+        return self.descriptors
+
+
+class ValueDescriptor(object):
+    """
+    GATT descriptor record with a fixed value, served by a ValueTree.
+    """
+    __slots__ = ('path', 'chrcPath', 'uuid', 'flags', 'value')
+
+    def __init__(self, path, chrcPath, uuid, flags, value):
+        self.path = dbus.ObjectPath(path)
+        self.chrcPath = chrcPath
+        self.uuid = uuid
+        self.flags = flag_array(flags)
+        self.value = bytes(value)
+
+    def get_path(self):
+        return self.path
+
+    def get_properties(self):
+        return {
+                GATT_DESC_IFACE: {
+                        'Characteristic': self.chrcPath,
+                        'UUID': self.uuid,
+                        'Flags': self.flags,
+                }
+        }
+
+
+#ValueTree only serves fixed values: no WriteValue, StartNotify or confirmations
+UNSERVED_FLAGS = {'write', 'write-without-response', 'reliable-write', 'writable-auxiliaries',
+                  'authenticated-signed-writes', 'encrypt-write', 'encrypt-authenticated-write', 'secure-write',
+                  'notify', 'indicate', 'encrypt-notify', 'encrypt-authenticated-notify', 'secure-notify',
+                  'encrypt-indicate', 'encrypt-authenticated-indicate', 'secure-indicate'}
+
+def check_definition(definition, children):
+    if not isinstance(definition, dict) or not isinstance(definition.get('uuid'), str):
+        raise ValueError(f'{definition!r} needs a uuid string')
+
+    entries = definition.get(children, []) if children else []
+    if not isinstance(entries, list): raise ValueError(f'{definition["uuid"]}: {children} must be a list')
+    return entries
+
+
+def check_value(definition):
+    flags = definition.get('flags', ['read'])
+    if not isinstance(flags, list) or not all(isinstance(flag, str) for flag in flags):
+        raise ValueError(f'{definition["uuid"]}: flags must be a list of strings')
+
+    unserved = UNSERVED_FLAGS.intersection(flags)
+    if unserved: raise ValueError(f'{definition["uuid"]} is a fixed value, remove {sorted(unserved)}')
+
+    if 'hex' in definition and not isinstance(definition['hex'], str):
+        raise ValueError(f'{definition["uuid"]}: hex must be a string')
+    definition_value(definition)
+
+
+def check_definitions(services):
+    #ValueTree trusts its definitions, so everything is checked here
+    if not isinstance(services, list): raise ValueError('services must be a list')
+
+    for serviceDef in services:
+        for chrcDef in check_definition(serviceDef, 'characteristics'):
+            check_value(chrcDef)
+            for descDef in check_definition(chrcDef, 'descriptors'):
+                check_definition(descDef, None)
+                check_value(descDef)
+
+    return services
+
+
+def device_info_definition(vendor, product, version):
+    return {'uuid': DEVICE_INFO_UUID, 'characteristics': [
+                {'uuid': uuid, 'value': value}
+                for (key, uuid, default), value in zip(DEVICE_INFO_STRINGS, (vendor, product, version))]}
+
+
+def definition_value(definition):
+    if 'hex' in definition: return bytearray.fromhex(definition['hex'])
+    return str(definition.get('value', '')).encode()
+
+
+def load_definitions(fileName):
+    """
+    Read service definitions from a .json or .toml file.
+
+    {
+        "services": [
+            {"uuid": "180A", "primary": true, "characteristics": [
+                {"uuid": "2A29", "flags": ["read"], "value": "HodgeCode"},
+                {"uuid": "2A50", "flags": ["read"], "hex": "0201000000",
+                 "descriptors": [{"uuid": "2901", "flags": ["read"], "value": "PnP ID"}]}
+            ]}
+        ]
+    }
+    """
+    if not isinstance(fileName, str): raise ValueError('definitions must name a file')
+
+    if fileName.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError('TOML definitions need Python 3.11 or later')
+
+        with open(fileName, 'rb') as definitionFile:
+            document = tomllib.load(definitionFile)
+    else:
+        with open(fileName) as definitionFile:
+            document = json.load(definitionFile)
+
+    if not isinstance(document, dict) or 'services' not in document:
+        raise ValueError('definitions need a "services" list')
+
+    return check_definitions(document['services'])
+
+
+class _ValueDescriptorTree(dbus.service.FallbackObject):
+
+    #dbus-python dispatches on the class attribute name, so the descriptor
+    #ReadValue lives in a base class and the characteristic ReadValue below
+    #shadows it only for GATT_CHRC_IFACE calls
+    @dbus.service.method(GATT_DESC_IFACE,
+                         in_signature='a{sv}',
+                         out_signature='ay',
+                         rel_path_keyword='relPath')
+    def ReadValue(self, options, relPath=None):
+        return self.get_node(relPath, ValueDescriptor).value
+
+
+class ValueTree(_ValueDescriptorTree):
+    """
+    Serves a whole tree of fixed value services from one D-Bus object.
+
+    The tree is built from declarative definitions (see load_definitions) into
+    ValueService, ValueCharacteristic and ValueDescriptor records, with their
+    values and flags computed once up front. Only the tree itself is
+    exported on the bus; calls for any path beneath it are resolved against
+    the records.
+    """
+    PATH_BASE = '/org/bluez/example/values'
+
+    def __init__(self, bus, index, definitions, pathBase=None):
+        self.path = (pathBase or self.PATH_BASE) + str(index)
+        self.nodes = {}
+        self.services = []
+
+        for serviceIndex, serviceDef in enumerate(definitions):
+            servicePath = dbus.ObjectPath(self.path + '/service' + str(serviceIndex))
+            chrcs = []
+
+            for chrcIndex, chrcDef in enumerate(serviceDef.get('characteristics', ())):
+                chrcPath = servicePath + '/char' + str(chrcIndex)
+                chrcPath = dbus.ObjectPath(chrcPath)
+                descs = [ValueDescriptor(chrcPath + '/desc' + str(descIndex), chrcPath,
+                                         descDef['uuid'], descDef.get('flags', ['read']),
+                                         definition_value(descDef))
+                         for descIndex, descDef in enumerate(chrcDef.get('descriptors', ()))]
+
+                chrcs.append(ValueCharacteristic(chrcPath, servicePath, chrcDef['uuid'],
+                                                 chrcDef.get('flags', ['read']),
+                                                 definition_value(chrcDef), descs))
+
+            service = ValueService(servicePath, serviceDef['uuid'], serviceDef.get('primary', True), chrcs)
+            self.services.append(service)
+
+        for service in self.services:
+            for obj in Application.get_objects(service):
+                self.nodes[obj.path[len(self.path):]] = obj
+
+        dbus.service.FallbackObject.__init__(self, bus, self.path)
+
+    def get_node(self, relPath, nodeType=None):
+        node = self.nodes.get(relPath)
+        if node is None or (nodeType and not isinstance(node, nodeType)):
+            raise InvalidArgsException()
+
+        return node
+
+    @dbus.service.method(DBUS_PROP_IFACE,
+                         in_signature='s',
+                         out_signature='a{sv}',
+                         rel_path_keyword='relPath')
+    def GetAll(self, interface, relPath=None):
+        properties = self.get_node(relPath).get_properties()
+        if interface not in properties:
+            raise InvalidArgsException()
+
+        return properties[interface]
+
+    @dbus.service.method(GATT_CHRC_IFACE,
+                         in_signature='a{sv}',
+                         out_signature='ay',
+                         rel_path_keyword='relPath')
+    def ReadValue(self, options, relPath=None):
+        return self.get_node(relPath, ValueCharacteristic).value
+
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature='aya{sv}', rel_path_keyword='relPath')
+    def WriteValue(self, value, options, relPath=None):
+        raise NotPermittedException()
+
+
+def measure_tree(bus, count=20):
+    """
+    Compare building count device information services from exported
+    Service/Characteristic objects against the same services loaded into a
+    ValueTree.
+    """
+    import tracemalloc
+
+    definitions = [device_info_definition(*(default for key, uuid, default in DEVICE_INFO_STRINGS))
+                   for index in range(count)]
+
+    def build_classes():
+        services = []
+        for index, serviceDef in enumerate(definitions):
+            service = Service(bus, 100 + index, serviceDef['uuid'], True)
+            for chrcIndex, chrcDef in enumerate(serviceDef['characteristics']):
+                chrc = Characteristic(bus, chrcIndex, chrcDef['uuid'], ['read'], service)
+                chrc.value = dbus.Array(definition_value(chrcDef), signature=dbus.Signature('y'))
+                service.add_characteristic(chrc)
+            services.append(service)
+
+        return services
+
+    def build_tree():
+        return ValueTree(bus, 100, definitions)
+
+    for name, build in (('classes', build_classes), ('value tree', build_tree)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        built = build()
+        elapsed = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print(f'{name}: {count} services in {elapsed * 1000:.2f} ms, '
+              f'{size} bytes ({size // (count * 4)} bytes per object)')
+
+        if isinstance(built, ValueTree):
+            built.remove_from_connection()
+        else:
+            for service in built:
+                for obj in Application.get_objects(service): obj.remove_from_connection()
+
 #sourceId="org.bluetooth.service.battery_service" type="primary" uuid="180F"
 class BatteryService(Service):
     """
@@ -267,15 +1066,15 @@ class BatteryService(Service):
     """
     SERVICE_UUID = '180f'
 
-    def __init__(self, bus, index):
-        Service.__init__(self, bus, index, self.SERVICE_UUID, True)
+    def __init__(self, bus, index, pathBase=None):
+        Service.__init__(self, bus, index, self.SERVICE_UUID, True, pathBase)
         self.add_characteristic(BatteryLevelCharacteristic(bus, 0, self))
 
 #name="Battery Level" sourceId="org.bluetooth.characteristic.battery_level" uuid="2A19"
 class BatteryLevelCharacteristic(Characteristic):
     """
     Fake Battery Level characteristic. The battery level is drained by 2 points
-    every 5 seconds.
+    every 60 seconds while a host is subscribed.
 
     """
     BATTERY_LVL_UUID = '2a19'
@@ -289,25 +1088,21 @@ class BatteryLevelCharacteristic(Characteristic):
         self.notifying = False
         self.notifyCnt = 0
         self.battery_lvl = 100
-        #self.timer = GObject.timeout_add(60000, self.drain_battery)
 
     def notify_battery_level(self):
         self.PropertiesChanged(GATT_CHRC_IFACE, { 'Value': [dbus.Byte(self.battery_lvl)] }, [])
         self.notifyCnt += 1
         
     def drain_battery(self):
-        if not self.notifying: return True
+        if not self.notifying: return False
         if(self.notifyCnt > 2): return False #Update battery level 3 times then stop
         
         if self.battery_lvl > 0:
             self.battery_lvl -= 2
-            if self.battery_lvl < 5:
-                #self.battery_lvl = 0
-                GObject.source_remove(self.timer)
                 
         print('Battery Level drained: ' + repr(self.battery_lvl))
         self.notify_battery_level()
-        return True
+        return self.battery_lvl >= 5
  
     def ReadValue(self, options):
         print('Battery Level read: ' + repr(self.battery_lvl))
@@ -321,7 +1116,8 @@ class BatteryLevelCharacteristic(Characteristic):
             return
 
         self.notifying = True
-        self.timer = GObject.timeout_add(60000, self.drain_battery)
+        self.service.idle.subscribe(self)
+        self.service.idle.arm(self, 'drain', 60000, self.drain_battery)
 
     def StopNotify(self):
         print('Stop Battery Notify')
@@ -331,82 +1127,23 @@ class BatteryLevelCharacteristic(Characteristic):
             return
 
         self.notifying = False
+        self.service.idle.disarm(self, 'drain')
+        self.service.idle.unsubscribe(self)
 
 
 #sourceId="org.bluetooth.service.device_information" type="primary" uuid="180A"
-class DeviceInfoService(Service):
-
-    SERVICE_UUID = '180A'
-
-    def __init__(self, bus, index):
-        Service.__init__(self, bus, index, self.SERVICE_UUID, True)
-        self.add_characteristic(VendorCharacteristic(bus, 0, self))
-        self.add_characteristic(ProductCharacteristic(bus, 1, self))
-        self.add_characteristic(VersionCharacteristic(bus, 2, self))
-
-#name="Manufacturer Name String" sourceId="org.bluetooth.characteristic.manufacturer_name_string" uuid="2A29"
-class VendorCharacteristic(Characteristic):
-
-    CHARACTERISTIC_UUID = '2A29'
-
-    def __init__(self, bus, index, service):
-        Characteristic.__init__(
-                self, bus, index,
-                self.CHARACTERISTIC_UUID,
-                ["read"],
-                service)
-        
-        self.value = dbus.Array('HodgeCode'.encode(), signature=dbus.Signature('y'))
-        print(f'***VendorCharacteristic value***: {self.value}')
-
-    def ReadValue(self, options):
-        print(f'Read VendorCharacteristic: {self.value}')
-        return self.value
-
-#sourceId="org.bluetooth.characteristic.model_number_string" uuid="2A24"
-class ProductCharacteristic(Characteristic):
-
-    CHARACTERISTIC_UUID = '2A24'
-
-    def __init__(self, bus, index, service):
-        Characteristic.__init__(
-                self, bus, index,
-                self.CHARACTERISTIC_UUID,
-                ["read"],
-                service)
-        
-        self.value = dbus.Array('smartRemotes'.encode(), signature=dbus.Signature('y'))
-        print(f'***ProductCharacteristic value***: {self.value}')
-
-    def ReadValue(self, options):
-        print(f'Read ProductCharacteristic: {self.value}')
-        return self.value
-
-#sourceId="org.bluetooth.characteristic.software_revision_string" uuid="2A28"
-class VersionCharacteristic(Characteristic):
-
-    CHARACTERISTIC_UUID = '2A28'
-
-    def __init__(self, bus, index, service):
-        Characteristic.__init__(
-                self, bus, index,
-                self.CHARACTERISTIC_UUID,
-                ["read"],
-                service)
-        
-        self.value = dbus.Array('version 1.0.0'.encode(), signature=dbus.Signature('y'))
-        print(f'***VersionCharacteristic value***: {self.value}')
-
-    def ReadValue(self, options):
-        print(f'Read VersionCharacteristic: {self.value}')
-        return self.value
+#manufacturer_name_string 2A29, model_number_string 2A24, software_revision_string 2A28
+DEVICE_INFO_UUID = '180A'
+DEVICE_INFO_STRINGS = (('vendor', '2A29', 'HodgeCode'),
+                       ('product', '2A24', 'smartRemotes'),
+                       ('version', '2A28', 'version 1.0.0'))
 
 #name="Human Interface Device" sourceId="org.bluetooth.service.human_interface_device" type="primary" uuid="1812"
 class HIDService(Service):
     SERVICE_UUID = '1812'
    
-    def __init__(self, bus, index):
-        Service.__init__(self, bus, index, self.SERVICE_UUID, True)
+    def __init__(self, bus, index, pathBase=None):
+        Service.__init__(self, bus, index, self.SERVICE_UUID, True, pathBase)
         
         self.protocolMode = ProtocolModeCharacteristic(bus, 0, self)
         self.hidInfo = HIDInfoCharacteristic(bus, 1, self)
@@ -414,6 +1151,7 @@ class HIDService(Service):
         self.reportMap = ReportMapCharacteristic(bus, 3, self)
         self.report1 = Report1Characteristic(bus, 4, self)
         self.report2 = Report2Characteristic(bus, 5, self)
+        self.report3 = Report3Characteristic(bus, 6, self)
         
         self.add_characteristic(self.protocolMode)
         self.add_characteristic(self.hidInfo)
@@ -421,6 +1159,7 @@ class HIDService(Service):
         self.add_characteristic(self.reportMap)
         self.add_characteristic(self.report1)
         self.add_characteristic(self.report2)
+        self.add_characteristic(self.report3)
         
 #name="Protocol Mode" sourceId="org.bluetooth.characteristic.protocol_mode" uuid="2A4E"
 class ProtocolModeCharacteristic(Characteristic):
@@ -448,8 +1187,8 @@ class ProtocolModeCharacteristic(Characteristic):
         
         #self.value = dbus.Array([1], signature=dbus.Signature('y'))
         self.parent = service
-        self.value = dbus.Array(bytearray.fromhex('01'), signature=dbus.Signature('y'))
-        print(f'***ProtocolMode value***: {self.value}')
+        self.value = value_array('01')
+        trace(f'***ProtocolMode value***: {self.value}')
 
     def ReadValue(self, options):
         print(f'Read ProtocolMode: {self.value}')
@@ -508,8 +1247,8 @@ class HIDInfoCharacteristic(Characteristic):
         </Field>
         '''
         
-        self.value = dbus.Array(bytearray.fromhex('01110002'), signature=dbus.Signature('y'))
-        print(f'***HIDInformation value***: {self.value}')
+        self.value = value_array('01110002')
+        trace(f'***HIDInformation value***: {self.value}')
 
     def ReadValue(self, options):
         print(f'Read HIDInformation: {self.value}')
@@ -527,8 +1266,8 @@ class ControlPointCharacteristic(Characteristic):
                 ["write-without-response"],
                 service)
         
-        self.value = dbus.Array(bytearray.fromhex('00'), signature=dbus.Signature('y'))
-        print(f'***ControlPoint value***: {self.value}')
+        self.value = value_array('00')
+        trace(f'***ControlPoint value***: {self.value}')
 
     def WriteValue(self, value, options):
         print(f'Write ControlPoint {value}')
@@ -539,6 +1278,8 @@ class ControlPointCharacteristic(Characteristic):
 class ReportMapCharacteristic(Characteristic):
 
     CHARACTERISTIC_UUID = '2A4B'
+    VALUE = ('05010906a1018501050719e029e71500250175019508810295017508150025650507190029658100c0050C0901A101850275109501150126ff0719012Aff078100C0'
+             '05010902a10185030901a1000509190129051500250195057501810295017503810105010930093116018026ff7f75109502810609381581257f750895018106050c0a38021581257f750895018106c0c0')
 
     def __init__(self, bus, index, service):
         Characteristic.__init__(
@@ -558,7 +1299,7 @@ class ReportMapCharacteristic(Characteristic):
         '''
         
         ##############################################################################################
-        # This Report Descriptor defines 2 Input Reports
+        # This Report Descriptor defines 3 Input Reports
         # ReportMap designed by HeadHodge
         #
         # <Report Layouts>
@@ -594,11 +1335,47 @@ class ReportMapCharacteristic(Characteristic):
         #           <Size>uint16</Size>
         #       </Field>
         #   </Report>
+        #   <Report>
+        #       <ReportId>3</ReportId>
+        #       <Description>HID Mouse Input (relative)</Description>
+        #       <Example>Move right 10 = [dbus.Byte(0x00), dbus.Byte(0x0a), dbus.Byte(0x00), dbus.Byte(0x00), dbus.Byte(0x00), dbus.Byte(0x00), dbus.Byte(0x00)]</Example>
+        #       <Field>
+        #           <Name>Mouse Buttons</Name>
+        #           <Size>uint8</Size>
+        #           <Format>
+        #               <Bit0>Left Button Pressed</Bit0>
+        #               <Bit1>Right Button Pressed</Bit1>
+        #               <Bit2>Middle Button Pressed</Bit2>
+        #               <Bit3>Back Button Pressed</Bit3>
+        #               <Bit4>Forward Button Pressed</Bit4>
+        #           </Format>
+        #       </Field>
+        #       <Field>
+        #           <Name>X Displacement</Name>
+        #           <Size>int16 (-32767..32767)</Size>
+        #       </Field>
+        #       <Field>
+        #           <Name>Y Displacement</Name>
+        #           <Size>int16 (-32767..32767)</Size>
+        #       </Field>
+        #       <Field>
+        #           <Name>Wheel</Name>
+        #           <Size>int8 (-127..127)</Size>
+        #       </Field>
+        #       <Field>
+        #           <Name>AC Pan</Name>
+        #           <Size>int8 (-127..127)</Size>
+        #       </Field>
+        #   </Report>
         # </Report Layouts>
         ##############################################################################################
   
         #USB HID Report Descriptor
-        self.value = dbus.Array(bytearray.fromhex('05010906a1018501050719e029e71500250175019508810295017508150025650507190029658100c0050C0901A101850275109501150126ff0719012Aff078100C0'))
+        self.value = value_array(self.VALUE)
+        trace(f'***ReportMap value***: {self.value}')
+
+    def set_value(self, reportMap):
+        self.value = value_array(reportMap)
         print(f'***ReportMap value***: {self.value}')
 
     def ReadValue(self, options):
@@ -631,7 +1408,7 @@ class Report1Characteristic(Characteristic):
         self.add_descriptor(Report1ReferenceDescriptor(bus, 1, self))
         
         self.value = [dbus.Byte(0x00),dbus.Byte(0x00)]
-        print(f'***Report value***: {self.value}')
+        trace(f'***Report value***: {self.value}')
         
     def send(self):
 
@@ -652,10 +1429,13 @@ class Report1Characteristic(Characteristic):
 
     def StartNotify(self):
         print(f'Start Start Report Keyboard Input')
-        GObject.timeout_add(10000, self.send)
+        self.service.idle.subscribe(self)
+        self.service.idle.arm(self, 'send', 10000, self.send)
 
     def StopNotify(self):
         print(f'Stop Report Keyboard Input')
+        self.service.idle.disarm(self, 'send')
+        self.service.idle.unsubscribe(self)
 
 
 #type="org.bluetooth.descriptor.report_reference" uuid="2908"
@@ -694,14 +1474,473 @@ class Report1ReferenceDescriptor(Descriptor):
         '''
        
         # This report uses ReportId 1 as defined in the ReportMap characteristic
-        self.value = dbus.Array(bytearray.fromhex('0101'), signature=dbus.Signature('y'))
-        print(f'***ReportReference***: {self.value}')
+        self.value = value_array('0101')
+        trace(f'***ReportReference***: {self.value}')
 
     def ReadValue(self, options):
         print(f'Read ReportReference: {self.value}')
         return self.value
 
 
+######################################################
+# CONSUMER USAGES
+######################################################
+# HID Usage Tables, Consumer Page (0x0C): https://www.usb.org/sites/default/files/documents/hut1_12v2.pdf
+# Every usage defined by HUT 1.12 (plus the later 0x67-0x7F display, camera and keyboard
+# backlight controls), named by their HUT title without spaces or punctuation.
+# Report 2 carries one usage id (1..0x07FF) as uint16, 0 releases.
+CONSUMER_USAGES = (
+    (0x0001, 'ConsumerControl'),
+    (0x0002, 'NumericKeyPad'),
+    (0x0003, 'ProgrammableButtons'),
+    (0x0004, 'Microphone'),
+    (0x0005, 'Headphone'),
+    (0x0006, 'GraphicEqualizer'),
+    (0x0020, 'Plus10'),
+    (0x0021, 'Plus100'),
+    (0x0022, 'AMPM'),
+    (0x0030, 'Power'),
+    (0x0031, 'Reset'),
+    (0x0032, 'Sleep'),
+    (0x0033, 'SleepAfter'),
+    (0x0034, 'SleepMode'),
+    (0x0035, 'Illumination'),
+    (0x0036, 'FunctionButtons'),
+    (0x0040, 'Menu'),
+    (0x0041, 'MenuPick'),
+    (0x0042, 'MenuUp'),
+    (0x0043, 'MenuDown'),
+    (0x0044, 'MenuLeft'),
+    (0x0045, 'MenuRight'),
+    (0x0046, 'MenuEscape'),
+    (0x0047, 'MenuValueIncrease'),
+    (0x0048, 'MenuValueDecrease'),
+    (0x0060, 'DataOnScreen'),
+    (0x0061, 'ClosedCaption'),
+    (0x0062, 'ClosedCaptionSelect'),
+    (0x0063, 'VCRTV'),
+    (0x0064, 'BroadcastMode'),
+    (0x0065, 'Snapshot'),
+    (0x0066, 'Still'),
+    (0x0067, 'PictureInPictureToggle'),
+    (0x0068, 'PictureInPictureSwap'),
+    (0x0069, 'RedMenuButton'),
+    (0x006A, 'GreenMenuButton'),
+    (0x006B, 'BlueMenuButton'),
+    (0x006C, 'YellowMenuButton'),
+    (0x006D, 'Aspect'),
+    (0x006E, '3DModeSelect'),
+    (0x006F, 'DisplayBrightnessIncrement'),
+    (0x0070, 'DisplayBrightnessDecrement'),
+    (0x0071, 'DisplayBrightness'),
+    (0x0072, 'DisplayBacklightToggle'),
+    (0x0073, 'DisplaySetBrightnessToMinimum'),
+    (0x0074, 'DisplaySetBrightnessToMaximum'),
+    (0x0075, 'DisplaySetAutoBrightness'),
+    (0x0076, 'CameraAccessEnabled'),
+    (0x0077, 'CameraAccessDisabled'),
+    (0x0078, 'CameraAccessToggle'),
+    (0x0079, 'KeyboardBrightnessIncrement'),
+    (0x007A, 'KeyboardBrightnessDecrement'),
+    (0x007B, 'KeyboardBacklightSetLevel'),
+    (0x007C, 'KeyboardBacklightOOC'),
+    (0x007D, 'KeyboardBacklightSetMinimum'),
+    (0x007E, 'KeyboardBacklightSetMaximum'),
+    (0x007F, 'KeyboardBacklightAuto'),
+    (0x0080, 'Selection'),
+    (0x0081, 'AssignSelection'),
+    (0x0082, 'ModeStep'),
+    (0x0083, 'RecallLast'),
+    (0x0084, 'EnterChannel'),
+    (0x0085, 'OrderMovie'),
+    (0x0086, 'Channel'),
+    (0x0087, 'MediaSelection'),
+    (0x0088, 'MediaSelectComputer'),
+    (0x0089, 'MediaSelectTV'),
+    (0x008A, 'MediaSelectWWW'),
+    (0x008B, 'MediaSelectDVD'),
+    (0x008C, 'MediaSelectTelephone'),
+    (0x008D, 'MediaSelectProgramGuide'),
+    (0x008E, 'MediaSelectVideoPhone'),
+    (0x008F, 'MediaSelectGames'),
+    (0x0090, 'MediaSelectMessages'),
+    (0x0091, 'MediaSelectCD'),
+    (0x0092, 'MediaSelectVCR'),
+    (0x0093, 'MediaSelectTuner'),
+    (0x0094, 'Quit'),
+    (0x0095, 'Help'),
+    (0x0096, 'MediaSelectTape'),
+    (0x0097, 'MediaSelectCable'),
+    (0x0098, 'MediaSelectSatellite'),
+    (0x0099, 'MediaSelectSecurity'),
+    (0x009A, 'MediaSelectHome'),
+    (0x009B, 'MediaSelectCall'),
+    (0x009C, 'ChannelIncrement'),
+    (0x009D, 'ChannelDecrement'),
+    (0x009E, 'MediaSelectSAP'),
+    (0x00A0, 'VCRPlus'),
+    (0x00A1, 'Once'),
+    (0x00A2, 'Daily'),
+    (0x00A3, 'Weekly'),
+    (0x00A4, 'Monthly'),
+    (0x00B0, 'Play'),
+    (0x00B1, 'Pause'),
+    (0x00B2, 'Record'),
+    (0x00B3, 'FastForward'),
+    (0x00B4, 'Rewind'),
+    (0x00B5, 'ScanNextTrack'),
+    (0x00B6, 'ScanPreviousTrack'),
+    (0x00B7, 'Stop'),
+    (0x00B8, 'Eject'),
+    (0x00B9, 'RandomPlay'),
+    (0x00BA, 'SelectDisc'),
+    (0x00BB, 'EnterDisc'),
+    (0x00BC, 'Repeat'),
+    (0x00BD, 'Tracking'),
+    (0x00BE, 'TrackNormal'),
+    (0x00BF, 'SlowTracking'),
+    (0x00C0, 'FrameForward'),
+    (0x00C1, 'FrameBack'),
+    (0x00C2, 'Mark'),
+    (0x00C3, 'ClearMark'),
+    (0x00C4, 'RepeatFromMark'),
+    (0x00C5, 'ReturnToMark'),
+    (0x00C6, 'SearchMarkForward'),
+    (0x00C7, 'SearchMarkBackwards'),
+    (0x00C8, 'CounterReset'),
+    (0x00C9, 'ShowCounter'),
+    (0x00CA, 'TrackingIncrement'),
+    (0x00CB, 'TrackingDecrement'),
+    (0x00CC, 'StopEject'),
+    (0x00CD, 'PlayPause'),
+    (0x00CE, 'PlaySkip'),
+    (0x00CF, 'VoiceCommand'),
+    (0x00E0, 'Volume'),
+    (0x00E1, 'Balance'),
+    (0x00E2, 'Mute'),
+    (0x00E3, 'Bass'),
+    (0x00E4, 'Treble'),
+    (0x00E5, 'BassBoost'),
+    (0x00E6, 'SurroundMode'),
+    (0x00E7, 'Loudness'),
+    (0x00E8, 'MPX'),
+    (0x00E9, 'VolumeIncrement'),
+    (0x00EA, 'VolumeDecrement'),
+    (0x00F0, 'SpeedSelect'),
+    (0x00F1, 'PlaybackSpeed'),
+    (0x00F2, 'StandardPlay'),
+    (0x00F3, 'LongPlay'),
+    (0x00F4, 'ExtendedPlay'),
+    (0x00F5, 'Slow'),
+    (0x0100, 'FanEnable'),
+    (0x0101, 'FanSpeed'),
+    (0x0102, 'LightEnable'),
+    (0x0103, 'LightIlluminationLevel'),
+    (0x0104, 'ClimateControlEnable'),
+    (0x0105, 'RoomTemperature'),
+    (0x0106, 'SecurityEnable'),
+    (0x0107, 'FireAlarm'),
+    (0x0108, 'PoliceAlarm'),
+    (0x0109, 'Proximity'),
+    (0x010A, 'Motion'),
+    (0x010B, 'DuressAlarm'),
+    (0x010C, 'HoldupAlarm'),
+    (0x010D, 'MedicalAlarm'),
+    (0x0150, 'BalanceRight'),
+    (0x0151, 'BalanceLeft'),
+    (0x0152, 'BassIncrement'),
+    (0x0153, 'BassDecrement'),
+    (0x0154, 'TrebleIncrement'),
+    (0x0155, 'TrebleDecrement'),
+    (0x0160, 'SpeakerSystem'),
+    (0x0161, 'ChannelLeft'),
+    (0x0162, 'ChannelRight'),
+    (0x0163, 'ChannelCenter'),
+    (0x0164, 'ChannelFront'),
+    (0x0165, 'ChannelCenterFront'),
+    (0x0166, 'ChannelSide'),
+    (0x0167, 'ChannelSurround'),
+    (0x0168, 'ChannelLowFrequencyEnhancement'),
+    (0x0169, 'ChannelTop'),
+    (0x016A, 'ChannelUnknown'),
+    (0x0170, 'SubChannel'),
+    (0x0171, 'SubChannelIncrement'),
+    (0x0172, 'SubChannelDecrement'),
+    (0x0173, 'AlternateAudioIncrement'),
+    (0x0174, 'AlternateAudioDecrement'),
+    (0x0180, 'ApplicationLaunchButtons'),
+    (0x0181, 'ALLaunchButtonConfigurationTool'),
+    (0x0182, 'ALProgrammableButtonConfiguration'),
+    (0x0183, 'ALConsumerControlConfiguration'),
+    (0x0184, 'ALWordProcessor'),
+    (0x0185, 'ALTextEditor'),
+    (0x0186, 'ALSpreadsheet'),
+    (0x0187, 'ALGraphicsEditor'),
+    (0x0188, 'ALPresentationApp'),
+    (0x0189, 'ALDatabaseApp'),
+    (0x018A, 'ALEmailReader'),
+    (0x018B, 'ALNewsreader'),
+    (0x018C, 'ALVoicemail'),
+    (0x018D, 'ALContactsAddressBook'),
+    (0x018E, 'ALCalendarSchedule'),
+    (0x018F, 'ALTaskProjectManager'),
+    (0x0190, 'ALLogJournalTimecard'),
+    (0x0191, 'ALCheckbookFinance'),
+    (0x0192, 'ALCalculator'),
+    (0x0193, 'ALAVCapturePlayback'),
+    (0x0194, 'ALLocalMachineBrowser'),
+    (0x0195, 'ALLANWANBrowser'),
+    (0x0196, 'ALInternetBrowser'),
+    (0x0197, 'ALRemoteNetworkingISPConnect'),
+    (0x0198, 'ALNetworkConference'),
+    (0x0199, 'ALNetworkChat'),
+    (0x019A, 'ALTelephonyDialer'),
+    (0x019B, 'ALLogon'),
+    (0x019C, 'ALLogoff'),
+    (0x019D, 'ALLogonLogoff'),
+    (0x019E, 'ALTerminalLockScreensaver'),
+    (0x019F, 'ALControlPanel'),
+    (0x01A0, 'ALCommandLineProcessorRun'),
+    (0x01A1, 'ALProcessTaskManager'),
+    (0x01A2, 'ALSelectTaskApplication'),
+    (0x01A3, 'ALNextTaskApplication'),
+    (0x01A4, 'ALPreviousTaskApplication'),
+    (0x01A5, 'ALPreemptiveHaltTaskApplication'),
+    (0x01A6, 'ALIntegratedHelpCenter'),
+    (0x01A7, 'ALDocuments'),
+    (0x01A8, 'ALThesaurus'),
+    (0x01A9, 'ALDictionary'),
+    (0x01AA, 'ALDesktop'),
+    (0x01AB, 'ALSpellCheck'),
+    (0x01AC, 'ALGrammarCheck'),
+    (0x01AD, 'ALWirelessStatus'),
+    (0x01AE, 'ALKeyboardLayout'),
+    (0x01AF, 'ALVirusProtection'),
+    (0x01B0, 'ALEncryption'),
+    (0x01B1, 'ALScreenSaver'),
+    (0x01B2, 'ALAlarms'),
+    (0x01B3, 'ALClock'),
+    (0x01B4, 'ALFileBrowser'),
+    (0x01B5, 'ALPowerStatus'),
+    (0x01B6, 'ALImageBrowser'),
+    (0x01B7, 'ALAudioBrowser'),
+    (0x01B8, 'ALMovieBrowser'),
+    (0x01B9, 'ALDigitalRightsManager'),
+    (0x01BA, 'ALDigitalWallet'),
+    (0x01BC, 'ALInstantMessaging'),
+    (0x01BD, 'ALOEMFeaturesTipsTutorialBrowser'),
+    (0x01BE, 'ALOEMHelp'),
+    (0x01BF, 'ALOnlineCommunity'),
+    (0x01C0, 'ALEntertainmentContentBrowser'),
+    (0x01C1, 'ALOnlineShoppingBrowser'),
+    (0x01C2, 'ALSmartCardInformationHelp'),
+    (0x01C3, 'ALMarketMonitorFinanceBrowser'),
+    (0x01C4, 'ALCustomizedCorporateNewsBrowser'),
+    (0x01C5, 'ALOnlineActivityBrowser'),
+    (0x01C6, 'ALResearchSearchBrowser'),
+    (0x01C7, 'ALAudioPlayer'),
+    (0x0200, 'GenericGUIApplicationControls'),
+    (0x0201, 'ACNew'),
+    (0x0202, 'ACOpen'),
+    (0x0203, 'ACClose'),
+    (0x0204, 'ACExit'),
+    (0x0205, 'ACMaximize'),
+    (0x0206, 'ACMinimize'),
+    (0x0207, 'ACSave'),
+    (0x0208, 'ACPrint'),
+    (0x0209, 'ACProperties'),
+    (0x021A, 'ACUndo'),
+    (0x021B, 'ACCopy'),
+    (0x021C, 'ACCut'),
+    (0x021D, 'ACPaste'),
+    (0x021E, 'ACSelectAll'),
+    (0x021F, 'ACFind'),
+    (0x0220, 'ACFindAndReplace'),
+    (0x0221, 'ACSearch'),
+    (0x0222, 'ACGoTo'),
+    (0x0223, 'ACHome'),
+    (0x0224, 'ACBack'),
+    (0x0225, 'ACForward'),
+    (0x0226, 'ACStop'),
+    (0x0227, 'ACRefresh'),
+    (0x0228, 'ACPreviousLink'),
+    (0x0229, 'ACNextLink'),
+    (0x022A, 'ACBookmarks'),
+    (0x022B, 'ACHistory'),
+    (0x022C, 'ACSubscriptions'),
+    (0x022D, 'ACZoomIn'),
+    (0x022E, 'ACZoomOut'),
+    (0x022F, 'ACZoom'),
+    (0x0230, 'ACFullScreenView'),
+    (0x0231, 'ACNormalView'),
+    (0x0232, 'ACViewToggle'),
+    (0x0233, 'ACScrollUp'),
+    (0x0234, 'ACScrollDown'),
+    (0x0235, 'ACScroll'),
+    (0x0236, 'ACPanLeft'),
+    (0x0237, 'ACPanRight'),
+    (0x0238, 'ACPan'),
+    (0x0239, 'ACNewWindow'),
+    (0x023A, 'ACTileHorizontally'),
+    (0x023B, 'ACTileVertically'),
+    (0x023C, 'ACFormat'),
+    (0x023D, 'ACEdit'),
+    (0x023E, 'ACBold'),
+    (0x023F, 'ACItalics'),
+    (0x0240, 'ACUnderline'),
+    (0x0241, 'ACStrikethrough'),
+    (0x0242, 'ACSubscript'),
+    (0x0243, 'ACSuperscript'),
+    (0x0244, 'ACAllCaps'),
+    (0x0245, 'ACRotate'),
+    (0x0246, 'ACResize'),
+    (0x0247, 'ACFlipHorizontal'),
+    (0x0248, 'ACFlipVertical'),
+    (0x0249, 'ACMirrorHorizontal'),
+    (0x024A, 'ACMirrorVertical'),
+    (0x024B, 'ACFontSelect'),
+    (0x024C, 'ACFontColor'),
+    (0x024D, 'ACFontSize'),
+    (0x024E, 'ACJustifyLeft'),
+    (0x024F, 'ACJustifyCenterH'),
+    (0x0250, 'ACJustifyRight'),
+    (0x0251, 'ACJustifyBlockH'),
+    (0x0252, 'ACJustifyTop'),
+    (0x0253, 'ACJustifyCenterV'),
+    (0x0254, 'ACJustifyBottom'),
+    (0x0255, 'ACJustifyBlockV'),
+    (0x0256, 'ACIndentDecrease'),
+    (0x0257, 'ACIndentIncrease'),
+    (0x0258, 'ACNumberedList'),
+    (0x0259, 'ACRestartNumbering'),
+    (0x025A, 'ACBulletedList'),
+    (0x025B, 'ACPromote'),
+    (0x025C, 'ACDemote'),
+    (0x025D, 'ACYes'),
+    (0x025E, 'ACNo'),
+    (0x025F, 'ACCancel'),
+    (0x0260, 'ACCatalog'),
+    (0x0261, 'ACBuyCheckout'),
+    (0x0262, 'ACAddToCart'),
+    (0x0263, 'ACExpand'),
+    (0x0264, 'ACExpandAll'),
+    (0x0265, 'ACCollapse'),
+    (0x0266, 'ACCollapseAll'),
+    (0x0267, 'ACPrintPreview'),
+    (0x0268, 'ACPasteSpecial'),
+    (0x0269, 'ACInsertMode'),
+    (0x026A, 'ACDelete'),
+    (0x026B, 'ACLock'),
+    (0x026C, 'ACUnlock'),
+    (0x026D, 'ACProtect'),
+    (0x026E, 'ACUnprotect'),
+    (0x026F, 'ACAttachComment'),
+    (0x0270, 'ACDeleteComment'),
+    (0x0271, 'ACViewComment'),
+    (0x0272, 'ACSelectWord'),
+    (0x0273, 'ACSelectSentence'),
+    (0x0274, 'ACSelectParagraph'),
+    (0x0275, 'ACSelectColumn'),
+    (0x0276, 'ACSelectRow'),
+    (0x0277, 'ACSelectTable'),
+    (0x0278, 'ACSelectObject'),
+    (0x0279, 'ACRedoRepeat'),
+    (0x027A, 'ACSort'),
+    (0x027B, 'ACSortAscending'),
+    (0x027C, 'ACSortDescending'),
+    (0x027D, 'ACFilter'),
+    (0x027E, 'ACSetClock'),
+    (0x027F, 'ACViewClock'),
+    (0x0280, 'ACSelectTimeZone'),
+    (0x0281, 'ACEditTimeZones'),
+    (0x0282, 'ACSetAlarm'),
+    (0x0283, 'ACClearAlarm'),
+    (0x0284, 'ACSnoozeAlarm'),
+    (0x0285, 'ACResetAlarm'),
+    (0x0286, 'ACSynchronize'),
+    (0x0287, 'ACSendReceive'),
+    (0x0288, 'ACSendTo'),
+    (0x0289, 'ACReply'),
+    (0x028A, 'ACReplyAll'),
+    (0x028B, 'ACForwardMsg'),
+    (0x028C, 'ACSend'),
+    (0x028D, 'ACAttachFile'),
+    (0x028E, 'ACUpload'),
+    (0x028F, 'ACDownload'),
+    (0x0290, 'ACSetBorders'),
+    (0x0291, 'ACInsertRow'),
+    (0x0292, 'ACInsertColumn'),
+    (0x0293, 'ACInsertFile'),
+    (0x0294, 'ACInsertPicture'),
+    (0x0295, 'ACInsertObject'),
+    (0x0296, 'ACInsertSymbol'),
+    (0x0297, 'ACSaveAndClose'),
+    (0x0298, 'ACRename'),
+    (0x0299, 'ACMerge'),
+    (0x029A, 'ACSplit'),
+    (0x029B, 'ACDistributeHorizontally'),
+    (0x029C, 'ACDistributeVertically'),
+)
+
+CONSUMER_ALIASES = {
+    'VolumeUp': 'VolumeIncrement',
+    'VolumeDown': 'VolumeDecrement',
+    'ChannelUp': 'ChannelIncrement',
+    'ChannelDown': 'ChannelDecrement',
+    'NextTrack': 'ScanNextTrack',
+    'PreviousTrack': 'ScanPreviousTrack',
+    'BrightnessUp': 'DisplayBrightnessIncrement',
+    'BrightnessDown': 'DisplayBrightnessDecrement',
+    'Back': 'ACBack',
+    'Home': 'ACHome',
+    'ALTerminalLock': 'ALTerminalLockScreensaver',
+}
+
+CONSUMER_USAGE_MAX = 0x07FF
+
+#compiled once at import: sorted ids, names in the same order and a name (any case) -> id index
+_consumerIds = array('H', [usage for usage, name in CONSUMER_USAGES])
+_consumerNames = tuple(name for usage, name in CONSUMER_USAGES)
+_consumerIndex = {name.lower(): usage for usage, name in CONSUMER_USAGES}
+_consumerIndex.update((alias.lower(), _consumerIndex[name.lower()]) for alias, name in CONSUMER_ALIASES.items())
+
+
+def consumer_usage(usage):
+    """
+    Resolve a consumer usage name (any case) or numeric id to its id.
+    """
+    if isinstance(usage, bool): raise ValueError(f'Not a consumer usage: {usage}')
+
+    if isinstance(usage, str):
+        usageId = _consumerIndex.get(usage.lower())
+        if usageId is None: raise ValueError(f'Unknown consumer usage: {usage}')
+        return usageId
+
+    usageId = int(usage)
+    if not 0 < usageId <= CONSUMER_USAGE_MAX: raise ValueError(f'Consumer usage out of range: {usage}')
+    return usageId
+
+
+def consumer_usage_name(usageId):
+    index = bisect.bisect_left(_consumerIds, usageId)
+    if index < len(_consumerIds) and _consumerIds[index] == usageId: return _consumerNames[index]
+    return f'0x{usageId:04X}'
+
+
+def encode_consumer_batch(usages):
+    """
+    Pack a press and release report for each usage into one buffer of
+    little endian uint16 Report 2 values.
+    """
+    reports = array('H')
+    for usage in usages:
+        reports.append(consumer_usage(usage))
+        reports.append(0)
+
+    if sys.byteorder == 'big': reports.byteswap()
+    return reports.tobytes()
+
+
 #id="report" name="Report" sourceId="org.bluetooth.characteristic.report" uuid="2A4D"        
 class Report2Characteristic(Characteristic):
 
@@ -726,17 +1965,55 @@ class Report2Characteristic(Characteristic):
         
         self.add_descriptor(Report2ReferenceDescriptor(bus, 1, self))
         
+        self.notifying = False
+        self.holding = None
         self.value = [dbus.Byte(0x00),dbus.Byte(0x00)]
-        print(f'***Report value***: {self.value}')
+        trace(f'***Report value***: {self.value}')
         
     def send(self):
 
         #send keyCode: 'VolumeUp'
         print(f'***send keyCode: "VolumeUp"***');
-        self.PropertiesChanged(GATT_CHRC_IFACE, { 'Value': [dbus.Byte(0xe9), dbus.Byte(0x00)] }, [])
-        self.PropertiesChanged(GATT_CHRC_IFACE, { 'Value': [dbus.Byte(0x00), dbus.Byte(0x00)] }, [])
+        self.send_usage('VolumeUp')
         print(f'***sent***')
         return True
+
+    def notify_batch(self, batch):
+        if not self.notifying:
+            #one entry per report, so HID_INPUT_BUFFER bounds reports rather than batches
+            if self.service.inputBuffer:
+                for offset in range(0, len(batch), 2): self.service.inputBuffer.push(self, batch[offset:offset + 2])
+            return False
+
+        for offset in range(0, len(batch), 2):
+            self.value = dbus.ByteArray(batch[offset:offset + 2])
+            self.PropertiesChanged(GATT_CHRC_IFACE, { 'Value': self.value }, [])
+
+        return True
+
+    def send_usage(self, usage):
+        return self.notify_batch(encode_consumer_batch((usage,)))
+
+    def send_sequence(self, usages):
+        return self.notify_batch(encode_consumer_batch(usages))
+
+    def press(self, usage, holdMs=None):
+        usageId = consumer_usage(usage)
+        if not self.notifying: return self.send_usage(usageId)  #a hold can't be replayed, keep it as a tap
+        if self.holding is not None: self.release()
+        if not self.notify_batch(struct.pack('<H', usageId)): return False
+
+        self.holding = usageId
+        if holdMs: self.service.idle.arm(self, 'release', holdMs, self.release)
+        return True
+
+    def release(self):
+        self.service.idle.disarm(self, 'release')
+        if self.holding is None: return False
+
+        self.holding = None
+        self.notify_batch(b'\x00\x00')
+        return False
                 
     def ReadValue(self, options):
         print(f'Read Report: {self.value}')
@@ -748,10 +2025,19 @@ class Report2Characteristic(Characteristic):
 
     def StartNotify(self):
         print(f'Start Report Consumer Input')
-        GObject.timeout_add(15000, self.send)
+        self.notifying = True
+        self.service.idle.subscribe(self)
+        self.service.idle.arm(self, 'send', 15000, self.send)
+
+        for batch in self.service.inputBuffer.take(self): self.notify_batch(batch)
 
     def StopNotify(self):
         print(f'Stop Start Report Consumer Input')
+        self.notifying = False
+        self.holding = None
+        self.service.idle.disarm(self, 'release')
+        self.service.idle.disarm(self, 'send')
+        self.service.idle.unsubscribe(self)
  
 
 #type="org.bluetooth.descriptor.report_reference" uuid="2908"
@@ -790,62 +2076,724 @@ class Report2ReferenceDescriptor(Descriptor):
         '''
         
         # This report uses ReportId 2 as defined in the ReportMap characteristic
-        self.value = dbus.Array(bytearray.fromhex('0201'), signature=dbus.Signature('y'))
-        print(f'***ReportReference***: {self.value}')
+        self.value = value_array('0201')
+        trace(f'***ReportReference***: {self.value}')
+
+    def ReadValue(self, options):
+        print(f'Read ReportReference: {self.value}')
+        return self.value
+
+
+class PointerAccumulator(object):
+    """
+    Sums relative pointer motion that arrives faster than reports are notified.
+
+    Each call to take() packs one Report 3 value. Accumulated motion larger than a
+    field can hold is saturated at the field limit and the remainder is carried
+    into the following reports, so no motion is lost or wrapped around.
+    """
+    XY_LIMIT = 32767
+    WHEEL_LIMIT = 127
+    BUTTONS_MASK = 0x1f
+
+    def __init__(self):
+        self.buttons = 0
+        self.buttonsChanged = False
+        self.dx = 0
+        self.dy = 0
+        self.wheel = 0
+        self.pan = 0
+
+    @staticmethod
+    def _clamp(value, limit):
+        if value > limit: return limit
+        if value < -limit: return -limit
+        return value
+
+    def add(self, dx=0, dy=0, wheel=0, pan=0):
+        self.dx += int(dx)
+        self.dy += int(dy)
+        self.wheel += int(wheel)
+        self.pan += int(pan)
+
+    def set_buttons(self, buttons):
+        buttons &= self.BUTTONS_MASK
+        if buttons == self.buttons: return
+        self.buttons = buttons
+        self.buttonsChanged = True
+
+    def pending(self):
+        return bool(self.buttonsChanged or self.dx or self.dy or self.wheel or self.pan)
+
+    def clear(self):
+        #buttons too: a release missed while unsubscribed must not leave a drag
+        self.buttons = 0
+        self.buttonsChanged = False
+        self.dx = self.dy = self.wheel = self.pan = 0
+
+    def take(self):
+        if not self.pending(): return None
+
+        x = self._clamp(self.dx, self.XY_LIMIT)
+        y = self._clamp(self.dy, self.XY_LIMIT)
+        wheel = self._clamp(self.wheel, self.WHEEL_LIMIT)
+        pan = self._clamp(self.pan, self.WHEEL_LIMIT)
+
+        self.dx -= x
+        self.dy -= y
+        self.wheel -= wheel
+        self.pan -= pan
+        self.buttonsChanged = False
+
+        return struct.pack('<Bhhbb', self.buttons, x, y, wheel, pan)
+
+
+#id="report" name="Report" sourceId="org.bluetooth.characteristic.report" uuid="2A4D"        
+class Report3Characteristic(Characteristic):
+
+    CHARACTERISTIC_UUID = '2A4D'
+    PACING_MS = 8   # 125 Hz notify pacing
+
+    def __init__(self, bus, index, service):
+        Characteristic.__init__(
+                self, bus, index,
+                self.CHARACTERISTIC_UUID,
+                ['secure-read', 'notify'],
+                service)
+                
+        '''
+        <Field name="Report Value">
+        <Requirement>Mandatory</Requirement>
+        <Format>uint8</Format>
+        <Repeated>true</Repeated>
+        </Field>
+        
+        Relative pointer report, see Report 3 in the ReportMap characteristic.
+        Motion is accumulated by move() and flushed at most once every PACING_MS.
+        Input without a subscribed host is dropped whatever the input policy,
+        replaying stale relative motion would only jump the cursor.
+        '''
+        
+        self.add_descriptor(Report3ReferenceDescriptor(bus, 1, self))
+        
+        self.accumulator = PointerAccumulator()
+        self.notifying = False
+        self.value = [dbus.Byte(0x00)] * 7
+        trace(f'***Report value***: {self.value}')
+
+    def move(self, dx=0, dy=0, wheel=0, pan=0):
+        if not self.notifying: return
+        self.accumulator.add(dx, dy, wheel, pan)
+        self.arm()
+
+    def set_buttons(self, buttons):
+        if not self.notifying: return
+
+        #don't merge a press and release into one report
+        if self.accumulator.buttonsChanged: self.flush()
+        self.accumulator.set_buttons(buttons)
+        self.arm()
+
+    def arm(self):
+        if not self.accumulator.pending(): return
+        self.service.idle.arm(self, 'pacing', self.PACING_MS, self.send)
+
+    def flush(self):
+        report = self.accumulator.take()
+        if report is None: return False
+
+        self.value = [dbus.Byte(b) for b in report]
+        self.PropertiesChanged(GATT_CHRC_IFACE, { 'Value': self.value }, [])
+        return True
+
+    def send(self):
+        return self.flush() and self.accumulator.pending()
+                
+    def ReadValue(self, options):
+        print(f'Read Report: {self.value}')
+        return self.value
+
+    def WriteValue(self, value, options):
+        print(f'Write Report {self.value}')
+        self.value = value
+
+    def StartNotify(self):
+        print(f'Start Report Mouse Input')
+        self.notifying = True
+        self.service.idle.add_queue(self.accumulator.pending)
+        self.service.idle.subscribe(self)
+
+    def StopNotify(self):
+        print(f'Stop Report Mouse Input')
+        self.notifying = False
+        self.accumulator.clear()
+        self.service.idle.disarm(self, 'pacing')
+        self.service.idle.unsubscribe(self)
+ 
+
+#type="org.bluetooth.descriptor.report_reference" uuid="2908"
+class Report3ReferenceDescriptor(Descriptor):
+
+    DESCRIPTOR_UUID = '2908'
+
+    def __init__(self, bus, index, characteristic):
+        Descriptor.__init__(
+                self, bus, index,
+                self.DESCRIPTOR_UUID,
+                ['read'],
+                characteristic)
+        
+        # This report uses ReportId 3 (Input Report) as defined in the ReportMap characteristic
+        self.value = value_array('0301')
+        trace(f'***ReportReference***: {self.value}')
 
     def ReadValue(self, options):
         print(f'Read ReportReference: {self.value}')
         return self.value
 
+######################################################
+# ADVERTISING
+######################################################
+class Advertisement(dbus.service.Object):
+    """
+    org.bluez.LEAdvertisement1 interface implementation
+    """
+    PATH_BASE = '/org/bluez/example/advertisement'
+    APPEARANCE = 0x03C1   # HID Keyboard
+
+    def __init__(self, bus, index, localName='smartRemotes'):
+        self.path = self.PATH_BASE + str(index)
+        self.bus = bus
+        self.localName = localName
+        self.serviceUUIDs = [HIDService.SERVICE_UUID]
+        self.discoverable = True
+        self.interval = None
+        self.advertiser = None
+        dbus.service.Object.__init__(self, bus, self.path)
+
+    def get_properties(self):
+        properties = {
+                LE_ADVERTISEMENT_IFACE: {
+                        'Type': 'peripheral',
+                        'ServiceUUIDs': dbus.Array(self.serviceUUIDs, signature='s'),
+                        'Appearance': dbus.UInt16(self.APPEARANCE),
+                        'LocalName': dbus.String(self.localName),
+                        'Discoverable': dbus.Boolean(self.discoverable),
+                }
+        }
+
+        #experimental in LEAdvertisement1, only sent when bluetoothd honours them
+        if self.interval:
+            properties[LE_ADVERTISEMENT_IFACE]['MinInterval'] = dbus.UInt32(self.interval[0])
+            properties[LE_ADVERTISEMENT_IFACE]['MaxInterval'] = dbus.UInt32(self.interval[1])
+
+        return properties
+
+    def get_path(self):
+        return dbus.ObjectPath(self.path)
+
+    @dbus.service.method(DBUS_PROP_IFACE,
+                         in_signature='s',
+                         out_signature='a{sv}')
+    def GetAll(self, interface):
+        if interface != LE_ADVERTISEMENT_IFACE:
+            raise InvalidArgsException()
+
+        return self.get_properties()[LE_ADVERTISEMENT_IFACE]
+
+    @dbus.service.method(LE_ADVERTISEMENT_IFACE, in_signature='', out_signature='')
+    def Release(self):
+        print(f'Advertisement released: {self.path}')
+        if self.advertiser: self.advertiser.released()
+
+
+class BondedHostCache(object):
+    """
+    Persisted list of host addresses that have bonded with this device.
+    """
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.hosts = []
+
+        try:
+            with open(fileName) as cacheFile:
+                self.hosts = [str(host) for host in json.load(cacheFile)]
+        except (OSError, ValueError):
+            pass
+
+    def __contains__(self, address):
+        return address in self.hosts
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.fileName), exist_ok=True)
+            with open(self.fileName, 'w') as cacheFile:
+                json.dump(self.hosts, cacheFile)
+        except OSError as error:
+            print(f'Bonded host cache not saved: {error}')
+
+    def add(self, address):
+        if address in self.hosts: return
+
+        #most recent host first
+        self.hosts.insert(0, address)
+        self.save()
+
+    def prune(self, paired):
+        hosts = [host for host in self.hosts if host in paired]
+        if hosts == self.hosts: return
+
+        self.hosts = hosts
+        self.save()
+
+
+class Advertiser(object):
+    """
+    Registers the Advertisement with LEAdvertisingManager1 and keeps it in step
+    with the connection state.
+
+    After a disconnect the device advertises at the fast interval for
+    FAST_TIMEOUT seconds so a sleeping host can reconnect quickly, then drops to
+    the slow interval. Advertising stops while a host is connected.
+
+    MinInterval/MaxInterval are [Experimental] in LEAdvertisement1 and a stock
+    bluetoothd ignores them. The fast/slow switch is only made when the
+    adapter reports HardwareOffload (extended advertising, which carries
+    per-advertisement intervals) or HID_ADV_INTERVALS is set for a bluetoothd
+    run with --experimental. Otherwise the advertisement is registered once
+    with bluetoothd's default interval.
+
+    The advertisement stays general discoverable so new hosts can pair. With
+    HID_DISCOVERABLE=unbonded it is only discoverable until the first host
+    bonds; bonded hosts (which already know the device) still reconnect.
+
+    A failed or released registration is retried with exponential backoff
+    from RETRY_MIN_MS up to RETRY_MAX_MS.
+    """
+    FAST_INTERVAL = (20, 30)      # milliseconds
+    SLOW_INTERVAL = (1000, 2500)  # milliseconds
+    FAST_TIMEOUT = 30             # seconds
+    RETRY_MIN_MS = 100
+    RETRY_MAX_MS = 10000
+
+    def __init__(self, bus, adapter, advertisement, bondedHosts):
+        self.bus = bus
+        self.advertisement = advertisement
+        self.advertisement.advertiser = self
+        self.bondedHosts = bondedHosts
+        self.connected = set()
+        self.mode = None
+        self.registered = False
+        self.timer = None
+        self.retryTimer = None
+        self.retryMs = self.RETRY_MIN_MS
+        self.intervals = ADV_INTERVALS
+        self.attach(adapter)
+
+        bus.add_signal_receiver(self.device_changed,
+                                dbus_interface=DBUS_PROP_IFACE,
+                                signal_name='PropertiesChanged',
+                                arg0=DEVICE_IFACE,
+                                path_keyword='path')
+
+    def attach(self, adapter):
+        self.adapter = adapter
+        adapterObject = self.bus.get_object(BLUEZ_SERVICE_NAME, adapter, introspect=False)
+        self.adManager = dbus.Interface(adapterObject, LE_ADVERTISING_MANAGER_IFACE)
+
+        dbus.Interface(adapterObject, DBUS_PROP_IFACE).Get(LE_ADVERTISING_MANAGER_IFACE, 'SupportedFeatures',
+                                                           reply_handler=self.features_cb,
+                                                           error_handler=lambda error: None)
+
+    def features_cb(self, features):
+        self.intervals = ADV_INTERVALS or 'HardwareOffload' in features
+        print(f'Advertising intervals honoured: {self.intervals}')
+
+    def reset(self):
+        if self.timer is not None:
+            GObject.source_remove(self.timer)
+            self.timer = None
+
+        if self.retryTimer is not None:
+            GObject.source_remove(self.retryTimer)
+            self.retryTimer = None
+
+        self.connected.clear()
+        self.mode = None
+        self.registered = False
+        self.retryMs = self.RETRY_MIN_MS
+
+    def start(self):
+        remote_om = dbus.Interface(self.bus.get_object(BLUEZ_SERVICE_NAME, '/', introspect=False),
+                                   DBUS_OM_IFACE)
+        remote_om.GetManagedObjects(reply_handler=self.devices_cb,
+                                    error_handler=self.devices_error_cb)
+
+    def devices_cb(self, objects):
+        paired = set()
+
+        for path, props in objects.items():
+            device = props.get(DEVICE_IFACE)
+            if not device or not path.startswith(self.adapter + '/'): continue
+            if device.get('Paired'): paired.add(str(device['Address']))
+            if device.get('Connected'): self.connected.add(str(device['Address']))
+
+        self.bondedHosts.prune(paired)
+        print(f'Bonded hosts: {self.bondedHosts.hosts}')
+        self.set_mode('off' if self.connected else 'fast')
+
+    def devices_error_cb(self, error):
+        print('Failed to read devices: ' + str(error))
+        self.set_mode('fast')
+
+    def set_mode(self, mode):
+        if self.timer is not None:
+            GObject.source_remove(self.timer)
+            self.timer = None
+
+        if mode == 'fast':
+            self.timer = GObject.timeout_add_seconds(self.FAST_TIMEOUT, self.fast_timeout)
+
+        #an unregistered advertisement is registered again even in the same mode
+        if mode == self.mode and (self.registered or mode == 'off'): return
+        self.mode = mode
+        print(f'Advertising mode: {mode}')
+
+        if self.retryTimer is not None:
+            GObject.source_remove(self.retryTimer)
+            self.retryTimer = None
+
+        if self.registered:
+            self.registered = False
+            self.adManager.UnregisterAdvertisement(self.advertisement.get_path(),
+                                                   reply_handler=lambda: None,
+                                                   error_handler=self.unregister_error_cb)
+
+        if mode == 'off': return
+        self.register()
+
+    def register(self):
+        if self.intervals:
+            self.advertisement.interval = self.FAST_INTERVAL if self.mode == 'fast' else self.SLOW_INTERVAL
+        else:
+            self.advertisement.interval = None
+        self.advertisement.discoverable = DISCOVERABLE == 'always' or len(self.bondedHosts) == 0
+        self.registered = True
+        self.adManager.RegisterAdvertisement(self.advertisement.get_path(), dbus.Dictionary({}, signature='sv'),
+                                             reply_handler=self.register_cb,
+                                             error_handler=self.register_error_cb)
+
+    def retry(self):
+        if self.retryTimer is not None or self.mode in (None, 'off'): return
+
+        print(f'Retrying advertisement in {self.retryMs} ms')
+        self.retryTimer = GObject.timeout_add(self.retryMs, self.retry_register)
+        self.retryMs = min(self.retryMs * 2, self.RETRY_MAX_MS)
+
+    def retry_register(self):
+        self.retryTimer = None
+        if not self.registered and self.mode not in (None, 'off'): self.register()
+        return False
+
+    def released(self):
+        if not self.registered: return
+        self.registered = False
+        self.retry()
+
+    def fast_timeout(self):
+        self.timer = None
+
+        #without intervals slow would only cost an unregister/register cycle
+        if self.intervals: self.set_mode('slow')
+        return False
+
+    def register_cb(self):
+        print(f'Advertisement registered: {self.mode}')
+        self.retryMs = self.RETRY_MIN_MS
+
+    def register_error_cb(self, error):
+        print('Failed to register advertisement: ' + str(error))
+        self.registered = False
+        self.retry()
+
+    def unregister_error_cb(self, error):
+        print('Failed to unregister advertisement: ' + str(error))
+
+    def device_changed(self, interface, changed, invalidated, path=None):
+        if not path.startswith(self.adapter + '/'): return
+        address = path.rsplit('/dev_', 1)[-1].replace('_', ':')
+
+        if changed.get('Paired'):
+            self.bondedHosts.add(address)
+
+        if 'Connected' not in changed: return
+
+        if changed['Connected']:
+            print(f'Host connected: {address}')
+            self.connected.add(address)
+            self.set_mode('off')
+            return
+
+        print(f'Host disconnected: {address}')
+        self.connected.discard(address)
+        if not self.connected: self.set_mode('fast')
+
 ######################################################
 # MAIN
 ######################################################
-def register_app_cb():
-    print('GATT application registered')
+class VirtualDevice(object):
+    """
+    One emulated HID device: its Application, advertising and config.
+
+    Devices share the process, bus connection and main loop. Each needs an
+    adapter of its own, since bluetoothd merges every application registered
+    on an adapter into that adapter's single GATT database.
+
+    The GATT tree is built up front; the adapter is attached once adapter
+    discovery replies, and again whenever bluetoothd comes back after a
+    restart. The tree and its cached properties are kept across restarts.
+    """
+    def __init__(self, bus, index, adapterName=None, name='smartRemotes',
+                 configFile=CONFIG_FILE, bondedHostsFile=None):
+        self.bus = bus
+        self.index = index
+        self.adapterName = adapterName
+        self.adapter = None
+        self.name = name
+        self.bondedHostsFile = bondedHostsFile
+        self.serviceManager = None
+        self.app = Application(bus, index)
+        self.watcher = ConfigWatcher(configFile, self.app)
+
+    def attach(self, adapterName, adapter):
+        self.adapterName = adapterName
+        self.adapter = adapter
+
+        bondedHostsFile = self.bondedHostsFile
+        if bondedHostsFile is None:
+            bondedBase, bondedExt = os.path.splitext(BONDED_HOSTS_FILE)
+            bondedHostsFile = BONDED_HOSTS_FILE if self.index == 0 else f'{bondedBase}.{adapterName}{bondedExt}'
+
+        if self.app.advertiser is None:
+            self.app.advertiser = Advertiser(self.bus, adapter, Advertisement(self.bus, self.index, self.name),
+                                             BondedHostCache(os.path.expanduser(bondedHostsFile)))
+        else:
+            self.app.advertiser.attach(adapter)
+
+        self.serviceManager = dbus.Interface(
+                self.bus.get_object(BLUEZ_SERVICE_NAME, adapter, introspect=False),
+                GATT_MANAGER_IFACE)
 
+    def register(self):
+        print(f'Registering GATT application {self.app.path} on {self.adapter}...')
+        self.app.register(self.serviceManager)
 
-def register_app_error_cb(error):
-    print('Failed to register application: ' + str(error))
-    mainloop.quit()
+    def close(self):
+        self.watcher.stop()
+        self.app.close()
 
 
-def find_adapter(bus):
-    remote_om = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, '/'),
-                               DBUS_OM_IFACE)
-    objects = remote_om.GetManagedObjects()
+def startup_complete():
+    if startup.done: return
+    if not all(device.app.registered or device.app.failed for device in devices): return
 
-    for o, props in objects.items():
+    startup.mark('registered')
+    startup.report()
+
+
+def register_app_cb(app):
+    print(f'GATT application registered: {app.path}')
+    bluez.registered()
+    startup_complete()
+
+
+def register_app_error_cb(app, error):
+    print(f'Failed to register application {app.path}: ' + str(error))
+    startup_complete()
+    bluez.retry()
+
+
+def find_adapters(objects):
+    adapters = {}
+    for o, props in sorted(objects.items()):
         if GATT_MANAGER_IFACE in props.keys():
-            return o
+            adapters[o.rsplit('/', 1)[-1]] = o
+
+    return adapters
+
+
+class BluezMonitor(object):
+    """
+    Finds adapters for the devices, registers them and follows bluetoothd.
+
+    When org.bluez loses its owner every device is detached; when it gets a
+    new one the adapters are rediscovered and the kept Applications are
+    registered again. Discovery or registration failures are retried with
+    exponential backoff from RETRY_MIN_MS up to RETRY_MAX_MS.
+    """
+    RETRY_MIN_MS = 100
+    RETRY_MAX_MS = 10000
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.owner = None
+        self.retryMs = self.RETRY_MIN_MS
+        self.timer = None
+        self.discovering = False
+
+        bus.watch_name_owner(BLUEZ_SERVICE_NAME, self.owner_changed)
+
+    def discover(self):
+        self.timer = None
+        if self.discovering: return False
+
+        #resolving the proxy raises while org.bluez has no owner
+        try:
+            remote_om = dbus.Interface(self.bus.get_object(BLUEZ_SERVICE_NAME, '/', introspect=False),
+                                       DBUS_OM_IFACE)
+        except dbus.exceptions.DBusException as error:
+            print('bluetoothd not available: ' + str(error))
+            self.retry()
+            return False
+
+        self.discovering = True
+        remote_om.GetManagedObjects(reply_handler=self.adapters_cb,
+                                    error_handler=self.adapters_error_cb)
+        return False
+
+    def retry(self):
+        #while org.bluez has no owner, owner_changed restarts discovery
+        if self.owner == '' or self.timer is not None or self.discovering: return
+
+        print(f'Retrying in {self.retryMs} ms')
+        self.timer = GObject.timeout_add(self.retryMs, self.discover)
+        self.retryMs = min(self.retryMs * 2, self.RETRY_MAX_MS)
+
+    def registered(self):
+        if all(device.app.registered for device in devices): self.retryMs = self.RETRY_MIN_MS
+
+    def owner_changed(self, owner):
+        previous, self.owner = self.owner, owner
+
+        #first call reports the owner at startup, discovery is already running
+        if previous is None or previous == owner: return
+
+        if self.timer is not None: GObject.source_remove(self.timer)
+        self.timer = None
+
+        if not owner:
+            print('bluetoothd stopped')
+            for device in devices: device.app.detach()
+            return
+
+        print('bluetoothd started')
+        self.retryMs = self.RETRY_MIN_MS
+        self.discover()
+
+    def adapters_cb(self, objects):
+        self.discovering = False
+        startup.mark('adapters')
+
+        adapters = find_adapters(objects)
+        if not adapters:
+            print('GattManager1 interface not found')
+            self.retry()
+            return
+
+        used = set(device.adapterName for device in devices if device.app.registered or device.app.pending)
+        for device in list(devices):
+            if device.app.registered or device.app.pending: continue
+            adapterName = device.adapterName or next(iter(adapters))
+
+            if adapterName not in adapters:
+                print(f'Device {device.index}: adapter {adapterName} not found')
+                self.retry()
+                continue
+
+            if adapterName in used:
+                print(f'Device {device.index}: adapter {adapterName} is already hosting a device')
+                devices.remove(device)
+                device.close()
+                continue
+
+            used.add(adapterName)
+            device.attach(adapterName, adapters[adapterName])
+            device.register()
+
+        if not devices: mainloop.quit()
+
+    def adapters_error_cb(self, error):
+        self.discovering = False
+        print('Failed to find adapters: ' + str(error))
+        self.retry()
+
+
+def load_devices(fileName):
+    """
+    Read the virtual device list. Without one, a single device is hosted on
+    the first adapter using CONFIG_FILE and BONDED_HOSTS_FILE.
+
+    [
+        {"adapter": "hci0", "name": "smartRemotes 0", "config": "~/.smartRemotes/kbd0.json"},
+        {"adapter": "hci1", "name": "smartRemotes 1", "config": "~/.smartRemotes/kbd1.json"}
+    ]
+    """
+    try:
+        with open(fileName) as devicesFile:
+            entries = json.load(devicesFile)
+    except OSError:
+        return [{}]
+    except ValueError as error:
+        print(f'Devices not loaded: {error}')
+        return [{}]
+
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        print('Devices not loaded: expected a list of objects')
+        return [{}]
+
+    #bluetoothd merges applications sharing an adapter, keep the first
+    kept, adapters = [], set()
+    for entry in entries:
+        adapterName = entry.get('adapter')
+        if adapterName is not None and adapterName in adapters:
+            print(f'Device entry for {adapterName} skipped: adapter is already hosting a device')
+            continue
+
+        adapters.add(adapterName)
+        kept.append(entry)
+
+    return kept
 
-    return None
 
 def main():
-    global mainloop
+    global mainloop, startup, bluez
+
+    startup = StartupTimer(_importStart)
+    startup.mark('import')
 
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
 
     bus = dbus.SystemBus()
 
-    adapter = find_adapter(bus)
-    if not adapter:
-        print('GattManager1 interface not found')
+    if '--measure' in sys.argv:
+        measure_tree(bus)
         return
 
-    service_manager = dbus.Interface(
-            bus.get_object(BLUEZ_SERVICE_NAME, adapter),
-            GATT_MANAGER_IFACE)
-
-    app = Application(bus)
+    #bluetoothd answers adapter discovery while the GATT trees are built
+    bluez = BluezMonitor(bus)
+    bluez.discover()
 
-    mainloop = GObject.MainLoop()
-
-    print('Registering GATT application...')
+    for index, entry in enumerate(load_devices(DEVICES_FILE)):
+        devices.append(VirtualDevice(bus, index, entry.get('adapter'), entry.get('name', 'smartRemotes'),
+                                     os.path.expanduser(entry.get('config', CONFIG_FILE)),
+                                     entry.get('bondedHosts')))
 
-    service_manager.RegisterApplication(app.get_path(), {},
-                                    reply_handler=register_app_cb,
-                                    error_handler=register_app_error_cb)
+    startup.mark('tree')
 
+    mainloop = GObject.MainLoop()
     mainloop.run()
 
 if __name__ == '__main__':
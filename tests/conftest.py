@@ -0,0 +1,44 @@
+import os
+import sys
+
+#gattServer.py is a script at the repo root, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+class Timers(object):
+    """
+    Stands in for GObject's timer calls so tests can see and fire sources.
+    """
+    def __init__(self):
+        self.sources = {}
+        self.lastId = 0
+
+    def timeout_add(self, interval, callback, *args):
+        self.lastId += 1
+        self.sources[self.lastId] = (interval, callback, args)
+        return self.lastId
+
+    def timeout_add_seconds(self, interval, callback, *args):
+        return self.timeout_add(interval * 1000, callback, *args)
+
+    def source_remove(self, sourceId):
+        return self.sources.pop(sourceId, None) is not None
+
+    def fire(self, sourceId):
+        interval, callback, args = self.sources[sourceId]
+        if not callback(*args): self.sources.pop(sourceId, None)
+
+
+@pytest.fixture
+def timers(monkeypatch):
+    timers = Timers()
+    monkeypatch.setattr('gattServer.GObject', timers)
+    return timers
+
+
+@pytest.fixture
+def unexported(monkeypatch):
+    #objects built with bus=None were never exported, removing them is a no-op
+    monkeypatch.setattr('dbus.service.Object.remove_from_connection', lambda self, *args, **kwargs: None)
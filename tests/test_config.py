@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('dbus')
+pytest.importorskip('gi')
+
+from gattServer import Application
+
+
+def device_info(app):
+    return [bytes(chrc.value) for chrc in app.deviceInfo.characteristics]
+
+
+def test_defaults_need_no_changes(timers):
+    app = Application(None)
+    app.apply_config({})
+
+    assert device_info(app) == [b'HodgeCode', b'smartRemotes', b'version 1.0.0']
+
+
+def test_string_changes_update_the_tree_in_place(timers):
+    app = Application(None)
+    tree = app.valueTree
+
+    app.apply_config({'vendor': 'Acme', 'version': 2})
+
+    assert app.valueTree is tree
+    assert device_info(app) == [b'Acme', b'smartRemotes', b'2']
+
+
+def test_removed_key_falls_back_to_its_default(timers):
+    app = Application(None)
+    app.apply_config({'vendor': 'Acme'})
+    app.apply_config({})
+
+    assert device_info(app)[0] == b'HodgeCode'
+
+
+def test_removed_battery_false_restores_the_battery(timers, unexported):
+    app = Application(None)
+    battery = app.battery
+    app.apply_config({'battery': False})
+    assert battery not in app.services
+
+    app.apply_config({})
+    assert app.battery in app.services
+
+
+def test_report_map_must_be_a_string(timers):
+    app = Application(None)
+    reportMap = app.hidService.reportMap.value
+
+    app.apply_config({'reportMap': 5})
+
+    assert app.hidService.reportMap.value is reportMap
@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip('dbus')
+pytest.importorskip('gi')
+
+from gattServer import CONSUMER_USAGES, consumer_usage, consumer_usage_name, encode_consumer_batch
+
+
+def test_table_is_sorted_and_unique():
+    ids = [usage for usage, name in CONSUMER_USAGES]
+    names = [name.lower() for usage, name in CONSUMER_USAGES]
+
+    assert ids == sorted(set(ids))
+    assert len(names) == len(set(names))
+
+
+@pytest.mark.parametrize('usage, expected', [
+    ('VolumeIncrement', 0xE9),
+    ('volumeup', 0xE9),
+    ('PlayPause', 0xCD),
+    ('ACFullScreenView', 0x230),
+    ('ALTerminalLock', 0x19E),
+    (0xE2, 0xE2),
+    (0x7FF, 0x7FF),
+])
+def test_consumer_usage_resolves_names_and_ids(usage, expected):
+    assert consumer_usage(usage) == expected
+
+
+@pytest.mark.parametrize('usage', ['NoSuchUsage', 0, 0x800, -1, True, False])
+def test_consumer_usage_rejects_invalid(usage):
+    with pytest.raises(ValueError):
+        consumer_usage(usage)
+
+
+def test_consumer_usage_name():
+    assert consumer_usage_name(0xE9) == 'VolumeIncrement'
+    assert consumer_usage_name(0x29C) == 'ACDistributeVertically'
+    assert consumer_usage_name(0x7FF) == '0x07FF'
+
+
+def test_encode_consumer_batch_packs_press_and_release():
+    assert encode_consumer_batch(['VolumeUp', 0xCD, 'ACPan']) == bytes.fromhex('e9000000cd00000038020000')
+    assert encode_consumer_batch([]) == b''
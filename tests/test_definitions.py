@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+pytest.importorskip('dbus')
+pytest.importorskip('gi')
+
+from gattServer import Application, check_definitions, load_definitions
+
+
+def service(**chrc):
+    return [{'uuid': '1234', 'characteristics': [dict({'uuid': '2A00'}, **chrc)]}]
+
+
+def test_read_only_definitions_load():
+    services = service(flags=['read'], hex='0102', descriptors=[{'uuid': '2901', 'value': 'name'}])
+    assert check_definitions(services) is services
+
+
+@pytest.mark.parametrize('services', [
+    'abc',
+    [{'characteristics': []}],
+    [{'uuid': '1234', 'characteristics': {}}],
+    service(flags='read'),
+    service(hex='zz'),
+    service(hex=5),
+    service(descriptors=[{'value': 'no uuid'}]),
+    service(flags=['read', 'write']),
+    service(flags=['read', 'notify']),
+    service(flags=['indicate']),
+])
+def test_invalid_definitions_are_rejected(services):
+    with pytest.raises(ValueError):
+        check_definitions(services)
+
+
+def test_definitions_must_name_a_file_with_services(tmp_path):
+    with pytest.raises(ValueError):
+        load_definitions(5)
+
+    fileName = tmp_path / 'services.json'
+    fileName.write_text(json.dumps([]))
+    with pytest.raises(ValueError):
+        load_definitions(str(fileName))
+
+
+def test_bad_definitions_keep_the_live_tree(timers, tmp_path):
+    app = Application(None)
+    tree = app.valueTree
+    fileName = tmp_path / 'services.json'
+    fileName.write_text(json.dumps({'services': service(hex='zz')}))
+
+    app.apply_config({'definitions': str(fileName)})
+
+    assert app.valueTree is tree
+    assert app.deviceInfo in app.services
+
+
+def test_definitions_are_served_after_device_information(timers, unexported, tmp_path):
+    app = Application(None)
+    fileName = tmp_path / 'services.json'
+    fileName.write_text(json.dumps({'services': service(value='fixed')}))
+
+    app.apply_config({'definitions': str(fileName)})
+
+    deviceInfo, loaded = app.valueTree.services
+    assert deviceInfo is app.deviceInfo
+    assert loaded.characteristics[0].value == b'fixed'
+    assert loaded.get_properties()['org.bluez.GattService1']['Characteristics'] == [loaded.characteristics[0].path]
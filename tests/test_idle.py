@@ -0,0 +1,97 @@
+import pytest
+
+pytest.importorskip('dbus')
+pytest.importorskip('gi')
+
+from gattServer import Application, IdleMonitor
+
+
+def test_starts_idle_and_wakes_on_subscribe(timers):
+    idle = IdleMonitor('test')
+    assert idle.idle
+
+    idle.subscribe('chrc')
+    assert not idle.idle
+
+    idle.unsubscribe('chrc')
+    assert idle.idle
+
+
+def test_idle_removes_every_armed_source(timers):
+    idle = IdleMonitor('test')
+    idle.subscribe('chrc')
+    idle.arm('chrc', 'send', 1000, lambda: True)
+    idle.arm('battery', 'drain', 60000, lambda: True)
+    assert len(timers.sources) == 2
+
+    idle.unsubscribe('chrc')
+
+    assert idle.idle
+    assert timers.sources == {}
+    assert idle.sources == {}
+
+
+def test_arm_is_keyed_by_owner_and_name(timers):
+    idle = IdleMonitor('test')
+    idle.subscribe('chrc')
+    idle.arm('chrc', 'send', 1000, lambda: True)
+    idle.arm('chrc', 'send', 1000, lambda: True)
+
+    assert len(timers.sources) == 1
+    assert idle.armed('chrc', 'send')
+
+    idle.disarm('chrc', 'send')
+    assert not idle.armed('chrc', 'send')
+    assert timers.sources == {}
+
+
+def test_wakeups_are_counted_and_a_finished_source_goes_idle(timers):
+    idle = IdleMonitor('test')
+    calls = []
+    idle.arm('chrc', 'release', 100, lambda: calls.append(1) and False)
+    assert not idle.idle
+
+    timers.fire(idle.sources[('chrc', 'release')])
+
+    assert calls == [1]
+    assert idle.wakeups == 1
+    assert idle.idle
+    assert timers.sources == {}
+
+
+def test_queued_reports_keep_the_device_awake(timers):
+    idle = IdleMonitor('test')
+    queue = ['report']
+    idle.add_queue(lambda: bool(queue))
+    idle.add_queue(idle.queues[0])
+    assert len(idle.queues) == 1
+
+    idle.subscribe('chrc')
+    idle.unsubscribe('chrc')
+    assert not idle.idle
+
+    queue.clear()
+    idle.check_idle()
+    assert idle.idle
+
+
+def test_services_share_the_application_monitor(timers):
+    app = Application(None)
+
+    for service in (app.hidService, app.battery):
+        assert service.idle is app.idle
+        assert service.inputBuffer is app.inputBuffer
+
+
+def test_removed_service_releases_its_subscription(timers, unexported):
+    app = Application(None)
+    level = app.battery.get_characteristics()[0]
+    level.StartNotify()
+    assert level in app.idle.subscribers
+    assert not app.idle.idle
+
+    app.remove_service(app.battery)
+
+    assert level not in app.idle.subscribers
+    assert app.idle.idle
+    assert timers.sources == {}
@@ -0,0 +1,92 @@
+import struct
+
+import pytest
+
+pytest.importorskip('dbus')
+pytest.importorskip('gi')
+
+from gattServer import PointerAccumulator
+
+
+def unpack(report):
+    return struct.unpack('<Bhhbb', report)
+
+
+def drain(accumulator):
+    reports = []
+    while True:
+        report = accumulator.take()
+        if report is None: return reports
+        reports.append(unpack(report))
+
+
+def test_sums_motion_between_reports():
+    accumulator = PointerAccumulator()
+    accumulator.add(3, -4, 1, 0)
+    accumulator.add(2, -1, 0, -1)
+
+    assert drain(accumulator) == [(0, 5, -5, 1, -1)]
+
+
+def test_saturates_at_field_limits_and_carries_remainder():
+    accumulator = PointerAccumulator()
+    accumulator.add(40000, -70000, 300, -5)
+
+    assert drain(accumulator) == [
+        (0, 32767, -32767, 127, -5),
+        (0, 7233, -32767, 127, 0),
+        (0, 0, -4466, 46, 0),
+    ]
+
+
+def test_press_and_release_stay_in_separate_reports():
+    accumulator = PointerAccumulator()
+    accumulator.set_buttons(0x01)
+    assert unpack(accumulator.take()) == (1, 0, 0, 0, 0)
+
+    accumulator.set_buttons(0x00)
+    assert unpack(accumulator.take()) == (0, 0, 0, 0, 0)
+    assert accumulator.take() is None
+
+
+def test_clear_releases_buttons():
+    accumulator = PointerAccumulator()
+    accumulator.set_buttons(0x01)
+    accumulator.take()
+    accumulator.clear()
+
+    accumulator.add(5, 0)
+    assert drain(accumulator) == [(0, 5, 0, 0, 0)]
+
+
+@pytest.fixture
+def report3():
+    from gattServer import HIDService, IdleMonitor
+
+    service = HIDService(None, 0)
+    service.idle = IdleMonitor()
+    report = service.report3
+    report.sent = []
+    report.PropertiesChanged = lambda interface, changed, invalidated: report.sent.append(bytes(changed['Value']))
+    report.StartNotify()
+    yield report
+    report.StopNotify()
+
+
+def test_quick_click_is_not_merged(report3):
+    report3.set_buttons(0x01)
+    report3.set_buttons(0x00)
+    report3.send()
+
+    assert [unpack(report)[0] for report in report3.sent] == [1, 0]
+
+
+def test_resubscribe_does_not_keep_buttons_pressed(report3):
+    report3.set_buttons(0x01)
+    report3.send()
+    report3.StopNotify()
+    report3.StartNotify()
+
+    report3.move(5, 0)
+    report3.send()
+    assert unpack(report3.sent[-1]) == (0, 5, 0, 0, 0)
@@ -0,0 +1,149 @@
+import pytest
+
+dbus = pytest.importorskip('dbus')
+pytest.importorskip('gi')
+
+from gattServer import Application, BluezMonitor, InputBuffer
+
+
+class ServiceManager(object):
+    """
+    GattManager1 stand-in that keeps the handlers of every call.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def RegisterApplication(self, path, options, reply_handler, error_handler):
+        self.calls.append(('register', reply_handler, error_handler))
+
+    def UnregisterApplication(self, path, reply_handler, error_handler):
+        self.calls.append(('unregister', reply_handler, error_handler))
+
+
+class Proxy(object):
+    def __init__(self):
+        self.calls = []
+
+    def get_dbus_method(self, member, interface):
+        return lambda *args, **kwargs: self.calls.append(member)
+
+
+class Bus(object):
+    def __init__(self, owned=True):
+        self.owned = owned
+        self.proxy = Proxy()
+
+    def watch_name_owner(self, name, callback):
+        self.ownerCallback = callback
+
+    def get_object(self, name, path, introspect=True):
+        if not self.owned: raise dbus.exceptions.DBusException('The name org.bluez was not provided')
+        return self.proxy
+
+
+def test_drop_policy_counts_every_report():
+    buffer = InputBuffer('drop', 4)
+
+    assert not buffer.push('chrc', b'\x01')
+    assert not buffer.push('chrc', b'\x02')
+    assert buffer.dropped == 2
+    assert buffer.take('chrc') == []
+    assert buffer.dropped == 0
+
+
+def test_buffer_policy_keeps_the_newest_reports():
+    buffer = InputBuffer('buffer', 2)
+
+    for report in (b'\x01', b'\x02', b'\x03'): assert buffer.push('chrc', report)
+
+    assert buffer.dropped == 1
+    assert buffer.take('chrc') == [b'\x02', b'\x03']
+    assert buffer.take('chrc') == []
+
+
+def test_take_only_returns_reports_of_its_owner():
+    buffer = InputBuffer('buffer', 4)
+    buffer.push('keyboard', b'\x01')
+    buffer.push('consumer', b'\x02')
+
+    assert buffer.take('consumer') == [b'\x02']
+    assert buffer.take('keyboard') == [b'\x01']
+
+
+def test_consumer_batches_are_bounded_by_reports(timers):
+    app = Application(None)
+    app.inputBuffer = InputBuffer('buffer', 8)
+    app.hidService.inputBuffer = app.inputBuffer
+    consumer = next(chrc for chrc in app.hidService.get_characteristics() if type(chrc).__name__ == 'Report2Characteristic')
+
+    consumer.send_sequence(['VolumeIncrement'] * 100)
+
+    assert len(app.inputBuffer.reports) == 8
+    assert all(len(report) == 2 for owner, report in app.inputBuffer.reports)
+    assert app.inputBuffer.dropped == 192
+
+
+def test_reregister_replies_after_detach_are_dropped(timers):
+    app = Application(None)
+    manager = ServiceManager()
+    app.serviceManager = manager
+    app.registered = True
+
+    app.reregister()
+    assert app.pending
+    action, reply, error = manager.calls[-1]
+    assert action == 'unregister'
+
+    #bluetoothd exits while UnregisterApplication is in flight
+    app.detach()
+    error(dbus.exceptions.DBusException('NoReply'))
+
+    assert not app.pending
+    assert not app.registered
+    assert [call[0] for call in manager.calls] == ['unregister']
+
+
+def test_reregister_registers_with_the_same_manager(timers):
+    app = Application(None)
+    manager = ServiceManager()
+    app.serviceManager = manager
+    app.registered = True
+
+    app.reregister()
+    manager.calls[-1][1]()
+
+    assert app.pending
+    assert [call[0] for call in manager.calls] == ['unregister', 'register']
+
+
+def test_discover_without_bluetoothd_keeps_retrying(timers):
+    bus = Bus(owned=False)
+    monitor = BluezMonitor(bus)
+
+    monitor.discover()
+    assert not monitor.discovering
+    assert len(timers.sources) == 1
+
+    #owner_changed reports the missing owner, then bluetoothd starts
+    monitor.owner_changed('')
+    bus.owned = True
+    monitor.owner_changed(':1.42')
+
+    assert monitor.discovering
+    assert timers.sources == {}
+    assert bus.proxy.calls == ['GetManagedObjects']
+
+
+def test_retry_backs_off_up_to_the_limit(timers):
+    monitor = BluezMonitor(Bus(owned=False))
+    delays = []
+
+    for attempt in range(10):
+        monitor.discover()
+        sourceId, (interval, callback, args) = next(iter(timers.sources.items()))
+        delays.append(interval)
+        timers.source_remove(sourceId)
+        monitor.timer = None
+
+    assert delays[:3] == [100, 200, 400]
+    assert delays[-1] == BluezMonitor.RETRY_MAX_MS